@@ -0,0 +1,146 @@
+"""
+In-Process API Response Cache
+Small thread-safe TTL + LRU cache for results from Spotify/Last.fm lookups
+that rarely change (artist genres, similar artists, search results)
+"""
+
+import functools
+import threading
+import time
+from collections import OrderedDict
+
+from singleflight import SingleFlight
+
+# Every TTLCache created, so they can be reset together
+_REGISTRY = []
+
+
+class TTLCache:
+    """
+    Thread-safe mapping whose entries expire after a fixed time-to-live.
+
+    When full, the least recently used entry is evicted.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        """
+        Initialize the cache.
+
+        Args:
+            maxsize: Maximum number of entries to keep
+            ttl: Seconds an entry stays valid after it is stored
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def get(self, key, default=None):
+        """
+        Look up a key, returning default if it is missing or expired.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        """
+        Store a value under key, evicting the oldest entry if the cache is full.
+        """
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        """
+        Remove key and return its value, or default if it is missing or expired.
+        """
+        with self._lock:
+            entry = self._data.pop(key, None)
+        if entry is None or entry[0] <= time.monotonic():
+            return default
+        return entry[1]
+
+    def remove_if(self, predicate):
+        """
+        Remove every entry whose key satisfies predicate(key).
+        """
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
+
+    def clear(self):
+        """
+        Remove every entry.
+        """
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+_MISSING = object()
+
+
+def clear_all_caches():
+    """
+    Empty every TTLCache, including those behind ttl_cache (e.g. between tests).
+    """
+    for cache in _REGISTRY:
+        cache.clear()
+
+
+def ttl_cache(maxsize: int, ttl: float, key=None, copy=None):
+    """
+    Decorator that memoizes a function's results in a TTLCache.
+
+    Empty results ([], {}, None) are not cached so that transient API
+    failures are retried on the next call. Concurrent misses for the same
+    key share one underlying call.
+
+    Args:
+        maxsize: Maximum number of cached results
+        ttl: Seconds each result stays valid
+        key: Optional function mapping the call's arguments to a cache key
+             (e.g. to leave the access token out of the key)
+        copy: Optional function applied to cached values before they are
+              returned, for results that callers mutate
+
+    Returns:
+        Decorator; the wrapped function exposes `.cache` and `.cache_clear()`
+    """
+    def decorator(func):
+        cache = TTLCache(maxsize, ttl)
+        flight = SingleFlight()
+
+        def load(cache_key, args, kwargs):
+            value = func(*args, **kwargs)
+            if value:
+                cache.set(cache_key, value)
+            return value
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            cache_key = key(*args, **kwargs) if key else (args, tuple(sorted(kwargs.items())))
+            value = cache.get(cache_key, _MISSING)
+            if value is _MISSING:
+                # Cache miss: run the call once even if several threads miss together
+                value = flight.do(cache_key, load, cache_key, args, kwargs)
+            return copy(value) if copy and value else value
+
+        wrapper.cache = cache
+        wrapper.cache_clear = cache.clear
+        return wrapper
+
+    return decorator
@@ -5,9 +5,12 @@ Main application file with routes, models, and configuration.
 
 # Standard library imports
 import json
+import logging
+import math
 import os
 import secrets
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
 from urllib.parse import urlencode
@@ -28,17 +31,33 @@ from wtforms.validators import InputRequired, Length, Regexp, ValidationError
 # Local imports
 from spotify_api import (
     add_track_to_spotify_library,
+    exchange_authorization_code,
+    get_artists_bulk,
+    get_tracks_bulk,
+    get_user_profile,
     get_user_recently_played,
     get_user_top_artists,
     get_user_top_tracks,
     get_valid_spotify_token,
+    invalidate_user_token,
     normalize_track,
+    rate_limit_remaining,
+    search_artists,
     search_tracks,
     get_app_token
 )
+from recommendation_engine import RecommendationEngine  # Last.fm primary, Spotify metadata
 
 load_dotenv()
 
+# Module loggers (recommendation engine, API helpers) log through the root logger;
+# set LOG_LEVEL=DEBUG to see per-request diagnostics
+logging.basicConfig(
+    level=os.environ.get('LOG_LEVEL', 'INFO').upper(),
+    format='%(asctime)s %(levelname)s %(name)s: %(message)s'
+)
+logger = logging.getLogger(__name__)
+
 BASE_DIR = Path(__file__).resolve().parent
 
 # Try to find templates-front-end directory
@@ -60,12 +79,11 @@ FRONTEND_DIR.mkdir(parents=True, exist_ok=True)
 STATIC_DIR.mkdir(parents=True, exist_ok=True)
 INSTANCE_DIR.mkdir(parents=True, exist_ok=True)
 
-# Debug: Print template directory location
-print(f"[DEBUG] Template directory: {FRONTEND_DIR}")
-print(f"[DEBUG] Template directory exists: {FRONTEND_DIR.exists()}")
+# Debug: Log template directory location
+logger.debug("Template directory: %s (exists: %s)", FRONTEND_DIR, FRONTEND_DIR.exists())
 if FRONTEND_DIR.exists():
     templates = list(FRONTEND_DIR.glob("*.html"))
-    print(f"[DEBUG] Found {len(templates)} HTML templates: {[t.name for t in templates]}")
+    logger.debug("Found %d HTML templates: %s", len(templates), [t.name for t in templates])
 
 app = Flask(
     __name__,
@@ -92,21 +110,16 @@ if not app.config['SECRET_KEY']:
     
     if production_mode:
         # In production, we must have a SECRET_KEY
-        print("ERROR: PRODUCTION mode detected but SECRET_KEY is missing or empty!")
-        print(f"DEBUG: PRODUCTION env var = '{os.environ.get('PRODUCTION')}'")
-        print(f"DEBUG: SECRET_KEY in os.environ = {'SECRET_KEY' in os.environ}")
+        logger.error("PRODUCTION mode detected but SECRET_KEY is missing or empty!")
         raw_value = os.environ.get('SECRET_KEY', '')
-        print(f"DEBUG: SECRET_KEY raw value type = {type(raw_value)}")
-        print(f"DEBUG: SECRET_KEY raw value repr = {repr(raw_value)}")
-        print(f"DEBUG: SECRET_KEY raw value length = {len(raw_value)}")
-        if raw_value:
-            print(f"DEBUG: SECRET_KEY after strip length = {len(raw_value.strip())}")
-            print(f"DEBUG: SECRET_KEY first 10 chars (repr) = {repr(raw_value[:10])}")
+        logger.error("PRODUCTION=%r, SECRET_KEY set: %s, length: %d (%d after strip)",
+                     os.environ.get('PRODUCTION'), 'SECRET_KEY' in os.environ,
+                     len(raw_value), len(raw_value.strip()))
         raise ValueError("SECRET_KEY environment variable is required in production! Please set SECRET_KEY in your deployment environment variables.")
     else:
         # Development fallback (NOT SECURE - only for local dev)
         app.config['SECRET_KEY'] = secrets.token_urlsafe(32)
-        print("⚠️  WARNING: Using auto-generated SECRET_KEY. Set SECRET_KEY environment variable for production!")
+        logger.warning("Using auto-generated SECRET_KEY. Set SECRET_KEY environment variable for production!")
 
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False  # Suppress deprecation warning
 db_path = BASE_DIR / 'database.db'
@@ -116,8 +129,6 @@ SPOTIFY_CLIENT_ID = os.environ.get('SPOTIFY_CLIENT_ID')
 SPOTIFY_CLIENT_SECRET = os.environ.get('SPOTIFY_CLIENT_SECRET')
 SPOTIFY_REDIRECT_URI = os.environ.get('SPOTIFY_REDIRECT_URI', 'http://localhost:5000/callback/spotify')
 SPOTIFY_AUTH_URL = 'https://accounts.spotify.com/authorize'
-SPOTIFY_TOKEN_URL = 'https://accounts.spotify.com/api/token'
-SPOTIFY_API_BASE_URL = 'https://api.spotify.com/v1'
 SPOTIFY_SCOPES = 'user-read-email user-read-private user-top-read user-read-recently-played user-library-read user-library-modify'
 
 # Store Spotify credentials in app config for spotify_api.py to access
@@ -136,7 +147,7 @@ if not db_path.exists() and instance_db_path.exists():
 
 # Database configuration - SQLite only
 app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{db_path}"
-print(f"Using SQLite database: {db_path}")
+logger.info("Using SQLite database: %s", db_path)
 
 bcrypt = Bcrypt(app)
 db = SQLAlchemy(app)
@@ -200,7 +211,7 @@ class User(db.Model, UserMixin):
         if self.failed_login_attempts >= max_attempts:
             self.account_locked = True
             self.locked_until = datetime.now(timezone.utc) + timedelta(minutes=lockout_duration_minutes)
-            print(f"Account {self.username} locked until {self.locked_until}")
+            logger.warning("Account %s locked until %s", self.username, self.locked_until)
         
         db.session.commit()
     
@@ -261,6 +272,24 @@ class RecommendationHistory(db.Model):
     # Relationship
     user = db.relationship('User', backref=db.backref('recommendations', lazy='dynamic', cascade='all, delete-orphan'))
 
+    def to_dict(self):
+        """Serialize for the recommendation history API."""
+        return {
+            'id': self.id,
+            'track_id': self.track_id,
+            'track_name': self.track_name,
+            'artist_name': self.artist_name,
+            'album_name': self.album_name,
+            'track_image_url': self.track_image_url,
+            'preview_url': self.preview_url,
+            'spotify_url': self.spotify_url,
+            'user_rating': self.user_rating,
+            'is_saved': self.is_saved,
+            'is_dismissed': self.is_dismissed,
+            'recommended_at': self.recommended_at.isoformat() if self.recommended_at else None,
+            'recommendation_reason': self.recommendation_reason
+        }
+
 class SavedTracks(db.Model):
     """User's saved/favorite tracks"""
     id = db.Column(db.Integer, primary_key=True)
@@ -295,7 +324,7 @@ def check_and_update_schema():
         if 'user' in tables:
             # Check existing columns
             columns = [col['name'] for col in inspector.get_columns('user')]
-            print(f"Existing columns in user table: {columns}")
+            logger.debug("Existing columns in user table: %s", columns)
             
             # Required columns for current schema
             required_columns = {
@@ -310,21 +339,20 @@ def check_and_update_schema():
             missing_columns = required_columns - existing_columns
             
             if missing_columns:
-                print(f"Missing columns detected: {missing_columns}")
-                print("⚠️  Recreating database with updated schema...")
-                print("⚠️  WARNING: This will delete all existing user data!")
+                logger.warning("Missing columns detected: %s", missing_columns)
+                logger.warning("Recreating database with updated schema; this deletes all existing user data!")
                 
                 # Drop and recreate the table
                 try:
                     db.drop_all()
                     db.create_all()
-                    print("✅ Database schema updated successfully!")
+                    logger.info("Database schema updated successfully")
                     return True
                 except Exception as e:
-                    print(f"❌ Error recreating tables: {str(e)}")
+                    logger.exception("Error recreating tables: %s", e)
                     return False
             else:
-                print("✅ Database schema is up to date.")
+                logger.info("Database schema is up to date")
                 return True
         return True
 
@@ -340,12 +368,12 @@ def init_db():
         
         if not schema_updated:
             # If schema update failed, drop and recreate
-            print("Schema update failed. Dropping and recreating tables...")
+            logger.warning("Schema update failed. Dropping and recreating tables...")
             db.drop_all()
             db.create_all()
-            print("Database tables recreated successfully!")
+            logger.info("Database tables recreated successfully")
         else:
-            print("Database tables created/updated successfully!")
+            logger.info("Database tables created/updated successfully")
 
 
 
@@ -391,7 +419,7 @@ class RegisterForm(FlaskForm):
             if existing_user:
                 raise ValidationError("This username is already taken. Please choose another.")
         except Exception as e:
-            print(f"Error validating username: {str(e)}")
+            logger.exception("Error validating username: %s", e)
     
     def validate_password(self, password):
         """Additional password strength validation."""
@@ -498,9 +526,7 @@ def login():
                 else:
                     flash('Invalid username or password. Please try again.', 'danger')
         except Exception as e:
-            print(f"Login error: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Login error: %s", e)
             flash('An error occurred during login. Please try again.', 'danger')
     
     return render_template('login.html', form=form)
@@ -561,7 +587,7 @@ def dashboard():
                 if search_results:
                     tracks = random.sample(search_results, min(3, len(search_results)))
         except Exception as e:
-            print(f"Error getting random tracks: {str(e)}")
+            logger.exception("Error getting random tracks: %s", e)
     
     return render_template('dashboard.html', tracks=tracks, is_spotify_user=is_spotify_user)
 
@@ -627,10 +653,7 @@ def register():
             
         except Exception as e:
             db.session.rollback()
-            import traceback
-            error_trace = traceback.format_exc()
-            print(f"Registration error: {str(e)}")
-            print(f"Traceback: {error_trace}")
+            logger.exception("Registration error: %s", e)
             
             error_str = str(e).lower()
             if 'unique constraint failed' in error_str or 'integrityerror' in error_str:
@@ -704,27 +727,14 @@ def spotify_callback():
     
     try:
         # Exchange code for access token
-        token_data = {
-            'grant_type': 'authorization_code',
-            'code': code,
-            'redirect_uri': SPOTIFY_REDIRECT_URI,
-            'client_id': SPOTIFY_CLIENT_ID,
-            'client_secret': SPOTIFY_CLIENT_SECRET
-        }
-        
-        token_response = requests.post(SPOTIFY_TOKEN_URL, data=token_data)
-        token_response.raise_for_status()
-        token_info = token_response.json()
+        token_info = exchange_authorization_code(code, SPOTIFY_REDIRECT_URI)
         
         access_token = token_info['access_token']
         refresh_token = token_info.get('refresh_token')
         expires_in = token_info.get('expires_in', 3600)
         
         # Get user profile from Spotify
-        headers = {'Authorization': f'Bearer {access_token}'}
-        profile_response = requests.get(f'{SPOTIFY_API_BASE_URL}/me', headers=headers)
-        profile_response.raise_for_status()
-        profile = profile_response.json()
+        profile = get_user_profile(access_token)
         
         spotify_id = profile['id']
         spotify_email = profile.get('email')
@@ -740,6 +750,7 @@ def spotify_callback():
             user.spotify_token_expires_at = datetime.now(timezone.utc) + timedelta(seconds=expires_in)
             user.last_login = datetime.now(timezone.utc)
             db.session.commit()
+            invalidate_user_token(user.id)
             
             login_user(user, remember=False)
             flash(f'Welcome back, {user.username}!', 'success')
@@ -774,13 +785,11 @@ def spotify_callback():
             return redirect(url_for('dashboard'))
     
     except requests.RequestException as e:
-        print(f"Spotify API error: {str(e)}")
+        logger.warning("Spotify API error: %s", e)
         flash('Failed to connect to Spotify. Please try again.', 'danger')
         return redirect(url_for('login'))
     except Exception as e:
-        print(f"Error in Spotify callback: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error in Spotify callback: %s", e)
         flash('An error occurred during Spotify login. Please try again.', 'danger')
         return redirect(url_for('login'))
 
@@ -800,11 +809,12 @@ def test_spotify_api():
     if not token:
         return jsonify({'error': 'No valid Spotify token. Please login with Spotify.'}), 401
     
-    # Test fetching top tracks
-    top_tracks = get_user_top_tracks(token, limit=5)
-    
-    # Test fetching top artists
-    top_artists = get_user_top_artists(token, limit=5)
+    # Test fetching top tracks and top artists (independent, so in parallel)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        top_tracks_future = executor.submit(get_user_top_tracks, token, limit=5)
+        top_artists_future = executor.submit(get_user_top_artists, token, limit=5)
+        top_tracks = top_tracks_future.result()
+        top_artists = top_artists_future.result()
     
     return jsonify({
         'message': 'Spotify API test successful',
@@ -870,7 +880,7 @@ def get_preferences():
         }), 200
         
     except Exception as e:
-        print(f"Error getting preferences: {str(e)}")
+        logger.exception("Error getting preferences: %s", e)
         return jsonify({'error': 'Failed to retrieve preferences'}), 500
 
 
@@ -937,7 +947,7 @@ def create_or_update_preferences():
             
     except Exception as e:
         db.session.rollback()
-        print(f"Error creating/updating preferences: {str(e)}")
+        logger.exception("Error creating/updating preferences: %s", e)
         return jsonify({'error': 'Failed to save preferences'}), 500
 
 
@@ -957,7 +967,7 @@ def delete_preferences():
             
     except Exception as e:
         db.session.rollback()
-        print(f"Error deleting preferences: {str(e)}")
+        logger.exception("Error deleting preferences: %s", e)
         return jsonify({'error': 'Failed to delete preferences'}), 500
 
 
@@ -995,21 +1005,7 @@ def get_recommendation_history():
         # Paginate
         paginated = query.paginate(page=page, per_page=per_page, error_out=False)
         
-        recommendations = [{
-            'id': rec.id,
-            'track_id': rec.track_id,
-            'track_name': rec.track_name,
-            'artist_name': rec.artist_name,
-            'album_name': rec.album_name,
-            'track_image_url': rec.track_image_url,
-            'preview_url': rec.preview_url,
-            'spotify_url': rec.spotify_url,
-            'user_rating': rec.user_rating,
-            'is_saved': rec.is_saved,
-            'is_dismissed': rec.is_dismissed,
-            'recommended_at': rec.recommended_at.isoformat() if rec.recommended_at else None,
-            'recommendation_reason': rec.recommendation_reason
-        } for rec in paginated.items]
+        recommendations = [rec.to_dict() for rec in paginated.items]
         
         return jsonify({
             'recommendations': recommendations,
@@ -1024,7 +1020,7 @@ def get_recommendation_history():
         }), 200
         
     except Exception as e:
-        print(f"Error getting recommendation history: {str(e)}")
+        logger.exception("Error getting recommendation history: %s", e)
         return jsonify({'error': 'Failed to retrieve recommendation history'}), 500
 
 
@@ -1041,24 +1037,10 @@ def get_recommendation(rec_id):
         if not rec:
             return jsonify({'error': 'Recommendation not found'}), 404
         
-        return jsonify({
-            'id': rec.id,
-            'track_id': rec.track_id,
-            'track_name': rec.track_name,
-            'artist_name': rec.artist_name,
-            'album_name': rec.album_name,
-            'track_image_url': rec.track_image_url,
-            'preview_url': rec.preview_url,
-            'spotify_url': rec.spotify_url,
-            'user_rating': rec.user_rating,
-            'is_saved': rec.is_saved,
-            'is_dismissed': rec.is_dismissed,
-            'recommended_at': rec.recommended_at.isoformat() if rec.recommended_at else None,
-            'recommendation_reason': rec.recommendation_reason
-        }), 200
+        return jsonify(rec.to_dict()), 200
         
     except Exception as e:
-        print(f"Error getting recommendation: {str(e)}")
+        logger.exception("Error getting recommendation: %s", e)
         return jsonify({'error': 'Failed to retrieve recommendation'}), 500
 
 
@@ -1091,7 +1073,7 @@ def rate_recommendation(rec_id):
         
     except Exception as e:
         db.session.rollback()
-        print(f"Error rating recommendation: {str(e)}")
+        logger.exception("Error rating recommendation: %s", e)
         return jsonify({'error': 'Failed to save rating'}), 500
 
 
@@ -1115,7 +1097,7 @@ def save_recommendation(rec_id):
         
     except Exception as e:
         db.session.rollback()
-        print(f"Error saving recommendation: {str(e)}")
+        logger.exception("Error saving recommendation: %s", e)
         return jsonify({'error': 'Failed to save recommendation'}), 500
 
 
@@ -1134,12 +1116,14 @@ def dismiss_recommendation(rec_id):
         
         rec.is_dismissed = True
         db.session.commit()
+        # Don't keep serving the dismissed track from cached results for the same seeds
+        invalidate_cached_recommendations(rec.recommendation_reason)
         
         return jsonify({'message': 'Recommendation dismissed successfully'}), 200
         
     except Exception as e:
         db.session.rollback()
-        print(f"Error dismissing recommendation: {str(e)}")
+        logger.exception("Error dismissing recommendation: %s", e)
         return jsonify({'error': 'Failed to dismiss recommendation'}), 500
 
 
@@ -1163,7 +1147,7 @@ def delete_recommendation(rec_id):
         
     except Exception as e:
         db.session.rollback()
-        print(f"Error deleting recommendation: {str(e)}")
+        logger.exception("Error deleting recommendation: %s", e)
         return jsonify({'error': 'Failed to delete recommendation'}), 500
 
 
@@ -1228,7 +1212,7 @@ def get_saved_tracks():
         }), 200
         
     except Exception as e:
-        print(f"Error getting saved tracks: {str(e)}")
+        logger.exception("Error getting saved tracks: %s", e)
         return jsonify({'error': 'Failed to retrieve saved tracks'}), 500
 
 
@@ -1258,7 +1242,7 @@ def get_saved_track(track_id):
         }), 200
         
     except Exception as e:
-        print(f"Error getting saved track: {str(e)}")
+        logger.exception("Error getting saved track: %s", e)
         return jsonify({'error': 'Failed to retrieve saved track'}), 500
 
 
@@ -1309,7 +1293,7 @@ def save_track():
         
     except Exception as e:
         db.session.rollback()
-        print(f"Error saving track: {str(e)}")
+        logger.exception("Error saving track: %s", e)
         return jsonify({'error': 'Failed to save track'}), 500
 
 
@@ -1338,7 +1322,7 @@ def update_saved_track(track_id):
         
     except Exception as e:
         db.session.rollback()
-        print(f"Error updating saved track: {str(e)}")
+        logger.exception("Error updating saved track: %s", e)
         return jsonify({'error': 'Failed to update notes'}), 500
 
 
@@ -1368,7 +1352,7 @@ def add_to_spotify_library():
             return jsonify({'error': 'Failed to add track to Spotify library'}), 500
             
     except Exception as e:
-        print(f"Error adding track to Spotify library: {str(e)}")
+        logger.exception("Error adding track to Spotify library: %s", e)
         return jsonify({'error': 'Failed to add track to Spotify library'}), 500
 
 
@@ -1392,7 +1376,7 @@ def delete_saved_track(track_id):
         
     except Exception as e:
         db.session.rollback()
-        print(f"Error deleting saved track: {str(e)}")
+        logger.exception("Error deleting saved track: %s", e)
         return jsonify({'error': 'Failed to remove saved track'}), 500
 
 
@@ -1418,63 +1402,31 @@ def public_search_artists():
             return jsonify({'error': 'Search query required', 'artists': []}), 400
         
         # Get best available token
-        token, _ = get_spotify_token()
+        token, token_type = get_spotify_token()
         if not token:
-            print("Failed to get Spotify token for artist search")
+            logger.error("Failed to get Spotify token for artist search")
             return jsonify({'error': 'Failed to authenticate with Spotify', 'artists': []}), 500
         
-        # Search for artists
-        url = 'https://api.spotify.com/v1/search'
-        headers = {'Authorization': f'Bearer {token}'}
-        params = {
-            'q': query,
-            'type': 'artist',
-            'limit': min(limit, 50)
-        }
-        
-        try:
-            response = requests.get(url, headers=headers, params=params, timeout=10)
-            
-            # Handle HTTP errors
-            if response.status_code == 401:
-                print("Spotify API returned 401 (unauthorized) - token may be expired")
-                return jsonify({'error': 'Authentication failed. Please try again.', 'artists': []}), 401
-            elif response.status_code == 429:
-                print("Spotify API rate limit exceeded")
-                return jsonify({'error': 'Too many requests. Please try again in a moment.', 'artists': []}), 429
-            elif response.status_code >= 400:
-                print(f"Spotify API error: {response.status_code} - {response.text}")
-                return jsonify({'error': 'Spotify API error. Please try again.', 'artists': []}), response.status_code
-            
-            response.raise_for_status()
-            data = response.json()
-            
-        except requests.Timeout:
-            print("Spotify API request timed out")
-            return jsonify({'error': 'Request timed out. Please try again.', 'artists': []}), 504
-        except requests.RequestException as e:
-            print(f"Spotify API request error: {str(e)}")
+        # Goes through the shared limiter so 429s pause every Spotify caller, not just this one
+        artists, status_code = search_artists(token, query, limit)
+        
+        # Handle HTTP errors
+        if status_code is None:
+            # Spotify rate limited us and the cooldown is still running: tell the
+            # client when to retry instead of reporting an outage
+            retry_after = rate_limit_remaining()
+            if retry_after > 0:
+                return jsonify({'error': 'Too many requests. Please try again in a moment.', 'artists': []}), 429, \
+                    {'Retry-After': str(math.ceil(retry_after))}
+            # Timed out or failed to connect
             return jsonify({'error': 'Failed to connect to Spotify. Please try again.', 'artists': []}), 503
-        
-        # Parse results
-        artists = []
-        artists_data = data.get('artists', {})
-        items = artists_data.get('items', [])
-        
-        for artist in items:
-            try:
-                artists.append({
-                    'id': artist['id'],
-                    'name': artist['name'],
-                    'genres': artist.get('genres', []),
-                    'image_url': artist['images'][0]['url'] if artist.get('images') and len(artist['images']) > 0 else None,
-                    'spotify_url': artist['external_urls']['spotify'],
-                    'popularity': artist.get('popularity', 0),
-                    'followers': artist.get('followers', {}).get('total', 0)
-                })
-            except (KeyError, IndexError) as e:
-                print(f"Error parsing artist data: {str(e)}")
-                continue
+        elif status_code == 401:
+            logger.warning("Spotify API returned 401 (unauthorized) - token may be expired")
+            if token_type == 'user':
+                invalidate_user_token(current_user.id)
+            return jsonify({'error': 'Authentication failed. Please try again.', 'artists': []}), 401
+        elif status_code >= 400:
+            return jsonify({'error': 'Spotify API error. Please try again.', 'artists': []}), status_code
         
         return jsonify({
             'artists': artists,
@@ -1482,9 +1434,7 @@ def public_search_artists():
         }), 200
         
     except Exception as e:
-        print(f"Error searching artists: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error searching artists: %s", e)
         return jsonify({'error': 'An unexpected error occurred. Please try again.', 'artists': []}), 500
 
 
@@ -1519,7 +1469,7 @@ def public_search_tracks():
         }), 200
         
     except Exception as e:
-        print(f"Error searching tracks: {str(e)}")
+        logger.exception("Error searching tracks: %s", e)
         return jsonify({'error': 'Failed to search tracks'}), 500
 
 
@@ -1528,7 +1478,7 @@ def public_get_genres():
     """Get list of available genre seeds for recommendations."""
     try:
         user_id = current_user.username if current_user.is_authenticated else "Anonymous"
-        print(f"Getting genres for user: {user_id}")
+        logger.debug("Getting genres for user: %s", user_id)
         
         # Try to get hardcoded fallback genres first (fastest)
         genres = get_fallback_genres()
@@ -1540,7 +1490,7 @@ def public_get_genres():
         }), 200
         
     except Exception as e:
-        print(f"Error getting genres: {str(e)}")
+        logger.exception("Error getting genres: %s", e)
         # Return fallback genres
         genres = get_fallback_genres()
         return jsonify({
@@ -1576,15 +1526,15 @@ def public_get_recommendations():
         # Get best available token
         token, using_user_token = get_spotify_token()
         if using_user_token and current_user.is_authenticated:
-            print(f"Using Spotify token for logged-in user: {current_user.username}")
+            logger.debug("Using Spotify token for logged-in user: %s", current_user.username)
         
         if not token:
             return jsonify({'error': 'Failed to authenticate with Spotify'}), 500
         
-        # Extract parameters
-        seed_artists = data.get('seed_artists', [])
-        seed_tracks = data.get('seed_tracks', [])
-        seed_genres = data.get('seed_genres', [])
+        # Extract parameters, dropping repeated seeds (order kept) so they don't use up the 5 seed slots
+        seed_artists = list(dict.fromkeys(data.get('seed_artists', [])))
+        seed_tracks = list(dict.fromkeys(data.get('seed_tracks', [])))
+        seed_genres = list(dict.fromkeys(data.get('seed_genres', [])))
         
         # Validate we have at least one seed
         if not seed_artists and not seed_tracks and not seed_genres:
@@ -1614,9 +1564,6 @@ def public_get_recommendations():
         if 'target_tempo' in data:
             rec_params['target_tempo'] = data['target_tempo']
         
-        # Use new recommendation engine (Last.fm primary, Spotify metadata)
-        from recommendation_engine import RecommendationEngine
-        
         # Get excluded track IDs for regeneration
         exclude_tracks = data.get('exclude_tracks', [])
         
@@ -1651,9 +1598,7 @@ def public_get_recommendations():
         }), 200
         
     except Exception as e:
-        print(f"Error getting public recommendations: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error getting public recommendations: %s", e)
         return jsonify({'error': 'Failed to get recommendations'}), 500
 
 
@@ -1687,7 +1632,7 @@ def get_recommendation_sessions():
             func.max(RecommendationHistory.recommended_at).desc()
         ).limit(20)
         
-        sessions = []
+        parsed_sessions = []
         for session in sessions_query.all():
             # Parse recommendation_reason to extract display text and seeds
             reason = session.recommendation_reason or "General recommendation"
@@ -1703,6 +1648,41 @@ def get_recommendation_sessions():
                 display_text = reason
                 seeds = {}
             
+            parsed_sessions.append((session, reason, display_text, seeds))
+        
+        # Sessions saved with seed IDs but no names: look every missing name up at
+        # once (one bulk artist and one bulk track request, in parallel) instead
+        # of making requests per session
+        missing_artist_ids = set()
+        missing_track_ids = set()
+        for _, _, _, seeds in parsed_sessions:
+            if seeds.get('artist_names') or seeds.get('track_names'):
+                continue
+            missing_artist_ids.update(seeds.get('artists', [])[:3])
+            missing_track_ids.update(seeds.get('tracks', [])[:3])
+        
+        artist_names_by_id = {}
+        track_names_by_id = {}
+        if missing_artist_ids or missing_track_ids:
+            try:
+                token, _ = get_spotify_token()
+                if token:
+                    with ThreadPoolExecutor(max_workers=2) as executor:
+                        artists_future = executor.submit(get_artists_bulk, token, list(missing_artist_ids))
+                        tracks_future = executor.submit(get_tracks_bulk, token, list(missing_track_ids))
+                        artist_names_by_id = {
+                            artist['id']: artist.get('name')
+                            for artist in artists_future.result()
+                            if artist and artist.get('id')
+                        }
+                        track_names_by_id = {
+                            tid: track.get('name') for tid, track in tracks_future.result().items()
+                        }
+            except Exception as e:
+                logger.warning("Error fetching seed names for session display: %s", e)
+        
+        sessions = []
+        for session, reason, display_text, seeds in parsed_sessions:
             # Build better display text with artist/track names if available
             final_display = display_text
             if seeds.get('artist_names') or seeds.get('track_names'):
@@ -1720,61 +1700,33 @@ def get_recommendation_sessions():
                 if parts:
                     final_display = f"Based on: {', '.join(parts)}"
             elif seeds.get('artists'):
-                # If we have artist IDs but no names, try to fetch them now
-                try:
-                    token, _ = get_spotify_token()
-                    if token:
-                        from spotify_api import get_artist_info
-                        artist_names = []
-                        for aid in seeds.get('artists', [])[:3]:
-                            try:
-                                artist_info = get_artist_info(token, aid)
-                                if artist_info and artist_info.get('name'):
-                                    artist_name = artist_info['name']
-                                    if artist_name not in artist_names:
-                                        artist_names.append(artist_name)
-                            except Exception as e:
-                                print(f"Error fetching artist name for {aid} in session display: {str(e)}")
-                                pass
-                        if artist_names:
-                            genre_names = seeds.get('genres', [])
-                            parts = artist_names[:]
-                            if genre_names:
-                                parts.extend(genre_names[:2])
-                            final_display = f"Based on: {', '.join(parts)}"
-                except Exception as e:
-                    print(f"Error fetching artist names for session display: {str(e)}")
-                    pass
+                # If we have artist IDs but no names, use the names fetched above
+                artist_names = []
+                for aid in seeds.get('artists', [])[:3]:
+                    artist_name = artist_names_by_id.get(aid)
+                    if artist_name and artist_name not in artist_names:
+                        artist_names.append(artist_name)
+                if artist_names:
+                    genre_names = seeds.get('genres', [])
+                    parts = artist_names[:]
+                    if genre_names:
+                        parts.extend(genre_names[:2])
+                    final_display = f"Based on: {', '.join(parts)}"
             
-            # If we have track IDs but no track names, try to fetch them now
+            # If we have track IDs but no track names, use the names fetched above
             if not final_display or final_display == display_text:
                 if seeds.get('tracks') and not seeds.get('track_names'):
-                    try:
-                        token, _ = get_spotify_token()
-                        if token:
-                            track_names = []
-                            for tid in seeds.get('tracks', [])[:3]:
-                                try:
-                                    url = f'https://api.spotify.com/v1/tracks/{tid}'
-                                    headers = {'Authorization': f'Bearer {token}'}
-                                    response = requests.get(url, headers=headers, timeout=5)
-                                    if response.status_code == 200:
-                                        track_info = response.json()
-                                        track_name = track_info.get('name')
-                                        if track_name and track_name not in track_names:
-                                            track_names.append(track_name)
-                                except Exception as e:
-                                    print(f"Error fetching track name for {tid} in session display: {str(e)}")
-                                    pass
-                            if track_names:
-                                genre_names = seeds.get('genres', [])
-                                parts = track_names[:]
-                                if genre_names:
-                                    parts.extend(genre_names[:2])
-                                final_display = f"Based on: {', '.join(parts)}"
-                    except Exception as e:
-                        print(f"Error fetching track names for session display: {str(e)}")
-                        pass
+                    track_names = []
+                    for tid in seeds.get('tracks', [])[:3]:
+                        track_name = track_names_by_id.get(tid)
+                        if track_name and track_name not in track_names:
+                            track_names.append(track_name)
+                    if track_names:
+                        genre_names = seeds.get('genres', [])
+                        parts = track_names[:]
+                        if genre_names:
+                            parts.extend(genre_names[:2])
+                        final_display = f"Based on: {', '.join(parts)}"
             
             sessions.append({
                 'reason': reason,  # Store full reason for fetching tracks
@@ -1791,9 +1743,7 @@ def get_recommendation_sessions():
         }), 200
         
     except Exception as e:
-        print(f"Error getting recommendation sessions: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error getting recommendation sessions: %s", e)
         return jsonify({'error': 'Failed to retrieve recommendation sessions'}), 500
 
 
@@ -1815,6 +1765,7 @@ def delete_recommendation_session():
         ).delete()
         
         db.session.commit()
+        invalidate_cached_recommendations(reason)
         
         return jsonify({
             'message': f'Deleted {deleted_count} recommendations',
@@ -1823,7 +1774,7 @@ def delete_recommendation_session():
         
     except Exception as e:
         db.session.rollback()
-        print(f"Error deleting recommendation session: {str(e)}")
+        logger.exception("Error deleting recommendation session: %s", e)
         return jsonify({'error': 'Failed to delete recommendation session'}), 500
 
 
@@ -1867,21 +1818,7 @@ def public_get_recommendation_history():
         # Paginate
         paginated = query.paginate(page=page, per_page=per_page, error_out=False)
         
-        recommendations = [{
-            'id': rec.id,
-            'track_id': rec.track_id,
-            'track_name': rec.track_name,
-            'artist_name': rec.artist_name,
-            'album_name': rec.album_name,
-            'track_image_url': rec.track_image_url,
-            'preview_url': rec.preview_url,
-            'spotify_url': rec.spotify_url,
-            'user_rating': rec.user_rating,
-            'is_saved': rec.is_saved,
-            'is_dismissed': rec.is_dismissed,
-            'recommended_at': rec.recommended_at.isoformat() if rec.recommended_at else None,
-            'recommendation_reason': rec.recommendation_reason
-        } for rec in paginated.items]
+        recommendations = [rec.to_dict() for rec in paginated.items]
         
         return jsonify({
             'recommendations': recommendations,
@@ -1896,7 +1833,7 @@ def public_get_recommendation_history():
         }), 200
         
     except Exception as e:
-        print(f"Error getting recommendation history: {str(e)}")
+        logger.exception("Error getting recommendation history: %s", e)
         return jsonify({'error': 'Failed to retrieve recommendation history'}), 500
 
 
@@ -1919,6 +1856,21 @@ def get_spotify_token():
     return None, None
 
 
+def invalidate_cached_recommendations(recommendation_reason):
+    """
+    Drop cached engine results for the seeds stored in a recommendation_reason.
+    
+    Args:
+        recommendation_reason: JSON reason saved with the recommendations
+            (older plain-text reasons carry no seeds and are ignored)
+    """
+    try:
+        seeds = json.loads(recommendation_reason).get('seeds', {})
+    except (json.JSONDecodeError, TypeError, AttributeError):
+        return
+    RecommendationEngine.invalidate(seeds.get('artists'), seeds.get('tracks'))
+
+
 def extract_track_data(rec):
     """
     Extract track data from recommendation dict, handling both standard and fallback formats.
@@ -2009,20 +1961,21 @@ def save_recommendations_to_history(recommendations, seed_artists=None, seed_gen
         if seed_artists:
             token, _ = get_spotify_token()
             if token:
-                from spotify_api import get_artist_info
-                for aid in seed_artists[:3]:  # Get names for up to 3 artists
-                    try:
-                        artist_info = get_artist_info(token, aid)
-                        if artist_info and artist_info.get('name'):
-                            artist_name = artist_info['name']
-                            if artist_name not in artist_names:  # Avoid duplicates
-                                artist_names.append(artist_name)
-                                reason_parts.append(artist_name)
-                    except Exception as e:
-                        print(f"Error fetching artist name for {aid}: {str(e)}")
+                # Get names for up to 3 artists in one request
+                artists_by_id = {
+                    artist['id']: artist
+                    for artist in get_artists_bulk(token, seed_artists[:3])
+                    if artist and artist.get('id')
+                }
+                for aid in seed_artists[:3]:
+                    artist_name = artists_by_id.get(aid, {}).get('name')
+                    if artist_name:
+                        if artist_name not in artist_names:  # Avoid duplicates
+                            artist_names.append(artist_name)
+                            reason_parts.append(artist_name)
+                    elif f"artist:{aid}" not in reason_parts:
                         # If we can't get name, just use ID
-                        if f"artist:{aid}" not in reason_parts:
-                            reason_parts.append(f"artist:{aid}")
+                        reason_parts.append(f"artist:{aid}")
             else:
                 # Fallback to IDs if no token
                 for aid in seed_artists[:2]:
@@ -2040,22 +1993,17 @@ def save_recommendations_to_history(recommendations, seed_artists=None, seed_gen
         if seed_tracks:
             token, _ = get_spotify_token()
             if token:
-                for tid in seed_tracks[:3]:  # Get names for up to 3 tracks
-                    try:
-                        url = f'https://api.spotify.com/v1/tracks/{tid}'
-                        headers = {'Authorization': f'Bearer {token}'}
-                        response = requests.get(url, headers=headers, timeout=5)
-                        if response.status_code == 200:
-                            track_info = response.json()
-                            track_name = track_info.get('name')
-                            if track_name and track_name not in track_names:
-                                track_names.append(track_name)
-                                reason_parts.append(track_name)
-                    except Exception as e:
-                        print(f"Error fetching track name for {tid}: {str(e)}")
+                # Get names for up to 3 tracks in one request
+                tracks_by_id = get_tracks_bulk(token, seed_tracks[:3])
+                for tid in seed_tracks[:3]:
+                    track_name = tracks_by_id.get(tid, {}).get('name')
+                    if track_name:
+                        if track_name not in track_names:
+                            track_names.append(track_name)
+                            reason_parts.append(track_name)
+                    elif f"track:{tid}" not in reason_parts:
                         # If we can't get name, just use ID
-                        if f"track:{tid}" not in reason_parts:
-                            reason_parts.append(f"track:{tid}")
+                        reason_parts.append(f"track:{tid}")
             else:
                 # Fallback to IDs if no token
                 for tid in seed_tracks[:2]:
@@ -2103,76 +2051,14 @@ def save_recommendations_to_history(recommendations, seed_artists=None, seed_gen
         if saved_count > 0:
             db.session.commit()
             username = current_user.username if current_user.is_authenticated else "Anonymous"
-            print(f"Saved {saved_count} recommendations to history for user {username}")
+            logger.debug("Saved %d recommendations to history for user %s", saved_count, username)
     except Exception as e:
         db.session.rollback()
-        import traceback
-        print(f"Error saving recommendations to history: {str(e)}")
-        traceback.print_exc()
+        logger.exception("Error saving recommendations to history: %s", e)
     
     return saved_count
 
 
-def get_app_access_token():
-    """
-    Get Spotify access token using Client Credentials flow.
-    This allows the app to access public Spotify data without user login.
-    Tokens are cached for 1 hour to reduce API calls.
-    
-    Returns:
-        str: Access token, or None if failed
-    """
-    # Check cache first
-    from spotify_api import _app_token_cache
-    now = datetime.now(timezone.utc)
-    
-    if (_app_token_cache['token'] and 
-        _app_token_cache['expires_at'] and 
-        now < _app_token_cache['expires_at'] - timedelta(minutes=5)):  # 5 min buffer
-        return _app_token_cache['token']
-    
-    try:
-        token_url = 'https://accounts.spotify.com/api/token'
-        
-        client_id = app.config.get('SPOTIFY_CLIENT_ID')
-        client_secret = app.config.get('SPOTIFY_CLIENT_SECRET')
-        
-        if not client_id or not client_secret:
-            print("Missing Spotify credentials")
-            return None
-        
-        # Request token using client credentials
-        auth_response = requests.post(token_url, data={
-            'grant_type': 'client_credentials',
-            'client_id': client_id,
-            'client_secret': client_secret
-        }, timeout=10)
-        
-        auth_response.raise_for_status()
-        token_data = auth_response.json()
-        
-        access_token = token_data['access_token']
-        expires_in = token_data.get('expires_in', 3600)  # Default 1 hour
-        
-        # Cache the token
-        _app_token_cache['token'] = access_token
-        _app_token_cache['expires_at'] = now + timedelta(seconds=expires_in)
-        
-        print(f"✅ Cached new app access token (expires in {expires_in}s)")
-        return access_token
-        
-    except requests.HTTPError as e:
-        if e.response.status_code == 429:
-            retry_after = int(e.response.headers.get('Retry-After', 60))
-            print(f"Rate limited when getting app token. Wait {retry_after} seconds.")
-        else:
-            print(f"Error getting app access token: HTTP {e.response.status_code}")
-        return None
-    except Exception as e:
-        print(f"Error getting app access token: {str(e)}")
-        return None
-
-
 def get_fallback_genres():
     """
     Return a hardcoded list of common Spotify genre seeds.
@@ -2206,10 +2092,7 @@ def get_fallback_genres():
 @app.errorhandler(500)
 def internal_error(error):
     db.session.rollback()
-    import traceback
-    error_trace = traceback.format_exc()
-    print(f"500 Error: {str(error)}")
-    print(f"Traceback: {error_trace}")
+    logger.exception("500 Error: %s", error)
     
     # Return JSON for API routes
     if request.path.startswith('/api/'):
@@ -0,0 +1,27 @@
+"""
+JSON Decoding Helpers
+Parses API response bodies with orjson when it is installed, falling back to
+the standard library decoder otherwise
+"""
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def response_json(response):
+    """
+    Decode the JSON body of a requests.Response.
+
+    Args:
+        response: requests.Response with a JSON body, or a stand-in that only
+            provides json() (e.g. a body replayed from a cache)
+
+    Returns:
+        The decoded JSON value (usually a dict)
+    """
+    content = getattr(response, 'content', None)
+    if orjson is not None and content is not None:
+        return orjson.loads(content)
+    return response.json()
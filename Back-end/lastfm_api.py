@@ -3,9 +3,18 @@ Last.fm API Helper Functions
 Provides similar artists, track recommendations, and genre data
 """
 
+import logging
 import os
 from typing import List, Dict, Optional
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from rate_limiter import TokenBucket
+from json_utils import response_json
+from api_cache import ttl_cache
+
+logger = logging.getLogger(__name__)
 
 # Last.fm API configuration
 LASTFM_API_KEY = os.environ.get('LASTFM_API_KEY')
@@ -14,6 +23,38 @@ LASTFM_API_BASE_URL = 'https://ws.audioscrobbler.com/2.0/'
 # Default headers
 headers = {'User-Agent': 'SoundMatch/1.0'}
 
+# Last.fm allows roughly 5 requests per second per API key
+_LASTFM_LIMITER = TokenBucket(rate=5, capacity=5)
+
+# Shared keep-alive session so the recommendation fan-out reuses TCP/TLS
+# connections to ws.audioscrobbler.com instead of reconnecting on every call.
+# Transient 5xx errors and dropped connections are retried by urllib3. Retry-After
+# is deliberately ignored there: 429s are left to _make_lastfm_request so the
+# limiter cooldown applies to every worker instead of one thread sleeping it out.
+_SESSION = requests.Session()
+_SESSION.headers.update(headers)
+_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=20,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.2,
+        backoff_max=5,
+        status_forcelist=(500, 502, 503, 504),
+        allowed_methods=frozenset(('GET',)),
+        respect_retry_after_header=False,
+        raise_on_status=False
+    )
+))
+
+# Last.fm similarity/tag data changes slowly; cache lookups for an hour
+_CACHE_TTL = 60 * 60
+
+# Attempts per call while rate limited, and the longest Retry-After worth waiting
+# out; beyond it calls fail fast until the cooldown has passed
+_MAX_ATTEMPTS = 3
+_MAX_RATE_LIMIT_WAIT = 10
+
 
 def _make_lastfm_request(method: str, params: dict, limit: int = 10) -> dict:
     """
@@ -39,14 +80,28 @@ def _make_lastfm_request(method: str, params: dict, limit: int = 10) -> dict:
             **params
         }
         
-        response = requests.get(LASTFM_API_BASE_URL, params=request_params, headers=headers, timeout=10)
-        response.raise_for_status()
-        return response.json()
+        for _ in range(_MAX_ATTEMPTS):
+            remaining = _LASTFM_LIMITER.cooldown_remaining()
+            if remaining > _MAX_RATE_LIMIT_WAIT:
+                logger.warning("Last.fm rate limited for another %.0fs, skipping %s", remaining, method)
+                return {}
+            
+            _LASTFM_LIMITER.acquire()
+            response = _SESSION.get(LASTFM_API_BASE_URL, params=request_params, timeout=10)
+            if response.status_code == 429:
+                # Back off every worker; the next acquire() waits out the cooldown
+                _LASTFM_LIMITER.cooldown(int(response.headers.get('Retry-After', 1)))
+                continue
+            response.raise_for_status()
+            return response_json(response)
+        
+        logger.warning("Last.fm still rate limiting %s after %d attempts", method, _MAX_ATTEMPTS)
+        return {}
     except requests.RequestException as e:
-        print(f"Error calling Last.fm API ({method}): {str(e)}")
+        logger.warning("Error calling Last.fm API (%s): %s", method, e)
         return {}
     except Exception as e:
-        print(f"Unexpected error in Last.fm API ({method}): {str(e)}")
+        logger.exception("Unexpected error in Last.fm API (%s): %s", method, e)
         return {}
 
 
@@ -70,6 +125,8 @@ def _normalize_list(data: dict, key: str) -> list:
     return items if isinstance(items, list) else []
 
 
+@ttl_cache(maxsize=4096, ttl=_CACHE_TTL,
+           key=lambda artist_name, limit=10: (artist_name.casefold(), limit))
 def get_similar_artists(artist_name: str, limit: int = 10) -> List[Dict]:
     """
     Get similar artists from Last.fm.
@@ -82,7 +139,7 @@ def get_similar_artists(artist_name: str, limit: int = 10) -> List[Dict]:
         list: List of similar artist dictionaries
     """
     if not LASTFM_API_KEY:
-        print("⚠️  Last.fm API key not configured")
+        logger.warning("Last.fm API key not configured")
         return []
     
     data = _make_lastfm_request('artist.getSimilar', {'artist': artist_name}, limit)
@@ -101,6 +158,8 @@ def get_similar_artists(artist_name: str, limit: int = 10) -> List[Dict]:
     ]
 
 
+@ttl_cache(maxsize=4096, ttl=_CACHE_TTL,
+           key=lambda track_name, artist_name, limit=10: (track_name.casefold(), artist_name.casefold(), limit))
 def get_similar_tracks(track_name: str, artist_name: str, limit: int = 10) -> List[Dict]:
     """
     Get similar tracks from Last.fm.
@@ -132,6 +191,8 @@ def get_similar_tracks(track_name: str, artist_name: str, limit: int = 10) -> Li
     ]
 
 
+@ttl_cache(maxsize=4096, ttl=_CACHE_TTL,
+           key=lambda artist_name, limit=10: (artist_name.casefold(), limit))
 def get_artist_top_tracks(artist_name: str, limit: int = 10) -> List[Dict]:
     """
     Get top tracks for an artist from Last.fm.
@@ -163,6 +224,8 @@ def get_artist_top_tracks(artist_name: str, limit: int = 10) -> List[Dict]:
     ]
 
 
+@ttl_cache(maxsize=4096, ttl=_CACHE_TTL,
+           key=lambda artist_name, limit=10: (artist_name.casefold(), limit))
 def get_artist_tags(artist_name: str, limit: int = 10) -> List[Dict]:
     """
     Get tags (genres) for an artist from Last.fm.
@@ -222,6 +285,8 @@ def search_artists(query: str, limit: int = 10) -> List[Dict]:
     ]
 
 
+@ttl_cache(maxsize=4096, ttl=_CACHE_TTL,
+           key=lambda tag, limit=10: (tag.casefold(), limit))
 def get_tag_top_artists(tag: str, limit: int = 10) -> List[Dict]:
     """
     Get top artists for a tag/genre from Last.fm.
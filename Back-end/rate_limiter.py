@@ -0,0 +1,70 @@
+"""
+Client-side Rate Limiting
+Token buckets that pace outbound API calls so bursts from the recommendation
+engine stay under each provider's rate limit instead of tripping 429s
+"""
+
+import random
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket with a shared cooldown window.
+
+    Callers reserve a token and sleep once for however long the bucket needs
+    to refill, so concurrent workers are spread out at a steady rate. A 429
+    seen by any worker can pause every caller via cooldown(); callers held
+    by a cooldown wake at jittered times so they don't all retry together.
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        """
+        Initialize the bucket (starts full).
+
+        Args:
+            rate: Tokens added per second (sustained request rate)
+            capacity: Maximum number of tokens (burst size)
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated_at = time.monotonic()
+        self._cooldown_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Take one token, blocking until it is available and any cooldown has passed.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            # Tokens may go negative: each caller reserves its slot in the queue
+            self._tokens -= 1
+            wait_time = -self._tokens / self.rate
+            cooldown_wait = self._cooldown_until - now
+
+        if cooldown_wait > wait_time:
+            wait_time = cooldown_wait * (1 + random.random() * 0.5)
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+    def cooldown(self, seconds: float):
+        """
+        Pause all callers for the given number of seconds (e.g. a 429 Retry-After).
+
+        Args:
+            seconds: How long to hold back further requests
+        """
+        with self._lock:
+            self._cooldown_until = max(self._cooldown_until, time.monotonic() + seconds)
+
+    def cooldown_remaining(self) -> float:
+        """
+        Seconds left in the current cooldown window (0 if none is active).
+        """
+        with self._lock:
+            return max(0.0, self._cooldown_until - time.monotonic())
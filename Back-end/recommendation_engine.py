@@ -5,18 +5,28 @@ Orchestrates recommendations using multiple APIs with clear responsibilities:
 - Spotify: Metadata provider (track details, search, artist info)
 """
 
+import copy
+import functools
+import heapq
+import itertools
+import logging
+import math
+import os
+import random
 from typing import List, Dict, Optional
 import requests
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
+from api_cache import TTLCache
+
 # Import API modules
 from spotify_api import (
-    get_artist_info,
+    get_artists_bulk,
     normalize_track,
     search_tracks,
-    get_artist_genres,
+    search_artist_catalog,
     get_recommendations as get_spotify_recommendations,
-    get_track
+    get_tracks_bulk
 )
 from lastfm_api import (
     get_similar_artists,
@@ -25,6 +35,96 @@ from lastfm_api import (
     get_artist_tags,
     get_tag_top_artists
 )
+
+logger = logging.getLogger(__name__)
+
+# Shared pool for speculative strategy calls (Spotify fallback / genre fill) that run
+# alongside the Last.fm pass. Only top-level strategy calls are submitted here.
+_STRATEGY_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix='rec-strategy')
+
+# Extra per-artist track lookups dispatched beyond the number needed, as a fraction
+# of it, so a few slow lookups don't hold up the response. Each extra lookup spends
+# Last.fm and Spotify rate-limit tokens, so keep this small.
+_HEDGE_RATIO = 0.5
+
+# Recent results keyed by canonical seeds, so page refreshes don't redo the fan-out
+_RESULT_CACHE = TTLCache(maxsize=2048, ttl=120)
+
+# How many tracks the Last.fm pass found last time for a seed set; when it filled
+# the limit, the Spotify strategies are not started speculatively for those seeds
+_LASTFM_YIELD = TTLCache(maxsize=2048, ttl=60 * 60)
+
+# Last.fm tags that describe listening habits rather than genres
+_NON_GENRE_TAGS = frozenset({
+    'seen live', 'favorites', 'favourite', 'seen', 'live', 'my music', 'all', 'awesome', 'cool'
+})
+
+# Similar artists matching a seed less than this are too weak to be worth a Spotify search
+_MIN_MATCH = float(os.environ.get('LASTFM_MIN_MATCH', 0.05))
+
+# Release-year filter for the Spotify fallback's genre searches
+_RECENT_YEARS = 'year:2020-2024'
+
+# Shared pool for individual Last.fm/Spotify calls made by every strategy.
+# Only leaf tasks (that never wait on other tasks) are submitted here, so
+# strategies can fan out into it without nesting pools or deadlocking.
+_IO_EXECUTOR = ThreadPoolExecutor(max_workers=16, thread_name_prefix='rec-io')
+
+
+def _new_tracks(tracks: List[Dict], seen: set):
+    """
+    Yield tracks whose IDs have not been seen yet, recording them in `seen`.
+    """
+    for track in tracks:
+        track_id = track.get('id')
+        if track_id and track_id not in seen:
+            seen.add(track_id)
+            yield track
+
+
+def _track_key(name: str) -> str:
+    """
+    Normalize a track name for matching Last.fm titles against Spotify's.
+    """
+    return ' '.join(name.casefold().split())
+
+
+def _track_artist_ids(track: Dict) -> List[str]:
+    """
+    Get the artist IDs of a Spotify track.
+    
+    Assumes Spotify's schema (a list of artist objects with 'id') and only
+    falls back to defensive checks when a payload doesn't match it.
+    """
+    try:
+        return [a['id'] for a in track.get('artists') or () if a['id']]
+    except (KeyError, TypeError):
+        return [a.get('id') for a in (track.get('artists') or [])
+                if isinstance(a, dict) and a.get('id')]
+
+
+def _top_artists_by_match(artists: List[Dict], k: int) -> List[Dict]:
+    """
+    Pick the k best-matching artists, dropping repeated names.
+    
+    Uses a bounded heap instead of sorting the whole list; ties (and lists
+    without match scores, such as tag top-artists) keep Last.fm's order.
+    
+    Args:
+        artists: Last.fm artist dicts, optionally carrying a 'match' score
+        k: Number of artists to keep
+    
+    Returns:
+        list: Up to k artists, highest match first
+    """
+    unique = {}
+    for artist in artists:
+        name = artist.get('name', '').casefold()
+        if name and name not in unique:
+            unique[name] = artist
+    return heapq.nlargest(k, unique.values(), key=lambda a: a.get('match', 0))
+
+
 class RecommendationEngine:
     """
     Main recommendation engine that coordinates between APIs.
@@ -38,6 +138,8 @@ class RecommendationEngine:
             spotify_token: Valid Spotify access token
         """
         self.spotify_token = spotify_token
+        self._artist_info_cache = {}
+        self._rng = random.Random()
     
     def get_recommendations(
         self,
@@ -66,7 +168,17 @@ class RecommendationEngine:
         seed_tracks = seed_tracks or []
         seed_genres = seed_genres or []
         exclude_track_ids = exclude_track_ids or []
-        exclude_set = set(exclude_track_ids)
+        # One seen-set shared by every synchronous strategy; excluded tracks count as seen
+        seen_ids = set(exclude_track_ids)
+        
+        # Regeneration (exclude_track_ids) always wants fresh tracks, so it bypasses the cache
+        cache_key = None
+        if not exclude_track_ids:
+            cache_key = (frozenset(seed_artists), frozenset(seed_tracks), frozenset(seed_genres),
+                         limit, expand_search)
+            cached = _RESULT_CACHE.get(cache_key)
+            if cached is not None:
+                return copy.deepcopy(cached)
         
         # If regenerating (exclude_track_ids provided), expand search to find more diverse tracks
         if exclude_track_ids:
@@ -92,63 +204,77 @@ class RecommendationEngine:
             
             # Strategy 1: Genre/Category-only recommendations (use Last.fm tags)
             if has_genres and not has_artists and not has_tracks:
-                print(f"Using genre-only recommendations for: {seed_genres}")
+                logger.debug("Using genre-only recommendations for: %s", seed_genres)
                 genre_recs = self._get_genre_only_recommendations(
                     seed_genres,
                     search_limit,
-                    expand_search=expand_search
+                    expand_search=expand_search,
+                    seen_ids=seen_ids
                 )
-                # Filter excluded tracks
-                genre_recs = [t for t in genre_recs if t.get('id') not in exclude_set]
                 result['tracks'] = genre_recs[:limit]
                 result['sources']['lastfm'] = len(genre_recs) > 0
-                print(f"✅ Genre-based recommendations: {len(result['tracks'])} tracks")
+                logger.debug("Genre-based recommendations: %d tracks", len(result['tracks']))
             
             # Strategy 2: Artist-based recommendations (Last.fm primary)
             elif has_artists:
+                # Resolve seed artists (names + genres) once, up front, so every strategy
+                # below reads them from the per-request cache
+                self._get_artists(seed_artists[:3])
+                
+                genre_strategy = None
+                if has_genres:
+                    genre_strategy = functools.partial(
+                        get_spotify_recommendations,
+                        self.spotify_token,
+                        seed_artists=seed_artists[:5],
+                        seed_genres=seed_genres[:5],
+                        limit=search_limit
+                    )
+                fallback_strategy = functools.partial(
+                    self._get_spotify_fallback_recommendations,
+                    seed_artists,
+                    search_limit,
+                    expand_search=expand_search
+                )
+                
+                # Start the Spotify-side strategies now so their latency overlaps with Last.fm,
+                # unless Last.fm filled the limit on its own for these seeds last time
+                yield_key = (frozenset(seed_artists), frozenset(seed_tracks), search_limit, expand_search)
+                genre_future = fallback_future = None
+                if _LASTFM_YIELD.get(yield_key, 0) < limit:
+                    if genre_strategy:
+                        genre_future = _STRATEGY_EXECUTOR.submit(genre_strategy)
+                    fallback_future = _STRATEGY_EXECUTOR.submit(fallback_strategy)
+                
                 # Step 1: Get recommendations from Last.fm (primary engine)
                 lastfm_tracks = self._get_lastfm_recommendations(
                     seed_artists, 
                     seed_tracks, 
                     search_limit,
-                    expand_search=expand_search
+                    expand_search=expand_search,
+                    seen_ids=seen_ids
                 )
-                # Filter out excluded tracks
-                lastfm_tracks = [t for t in lastfm_tracks if t.get('id') not in exclude_set]
                 result['tracks'] = lastfm_tracks
                 result['sources']['lastfm'] = len(lastfm_tracks) > 0
+                _LASTFM_YIELD.set(yield_key, len(lastfm_tracks))
                 
                 # Step 2: If not enough and genres provided, add genre-based recommendations
-                if len(result['tracks']) < limit and has_genres:
-                    genre_tracks = get_spotify_recommendations(
-                        self.spotify_token,
-                        seed_artists=seed_artists[:5] if seed_artists else None,
-                        seed_genres=seed_genres[:5],
-                        limit=search_limit - len(result['tracks'])
-                    )
-                    # Filter excluded and merge
-                    existing_ids = {t.get('id') for t in result['tracks']}
-                    for track in genre_tracks:
-                        track_id = track.get('id')
-                        if track_id and track_id not in existing_ids and track_id not in exclude_set:
-                            result['tracks'].append(track)
-                            existing_ids.add(track_id)
+                # (run here if it wasn't started speculatively)
+                if len(result['tracks']) < limit and genre_strategy:
+                    genre_tracks = self._strategy_result(genre_future, genre_strategy)
+                    # Skip excluded and already-used tracks
+                    result['tracks'].extend(_new_tracks(genre_tracks, seen_ids))
                 
                 # Step 3: If still not enough, use Spotify search as fallback
                 if len(result['tracks']) < limit:
-                    spotify_tracks = self._get_spotify_fallback_recommendations(
-                        seed_artists, 
-                        search_limit - len(result['tracks']),
-                        expand_search=expand_search
-                    )
+                    spotify_tracks = self._strategy_result(fallback_future, fallback_strategy)
                     # Merge without duplicates
-                    existing_ids = {t.get('id') for t in result['tracks']}
-                    for track in spotify_tracks:
-                        track_id = track.get('id')
-                        if track_id and track_id not in existing_ids and track_id not in exclude_set:
-                            result['tracks'].append(track)
-                            existing_ids.add(track_id)
+                    result['tracks'].extend(_new_tracks(spotify_tracks, seen_ids))
                     result['sources']['spotify'] = len(spotify_tracks) > 0
+                elif fallback_future:
+                    fallback_future.cancel()
+                if genre_future and len(lastfm_tracks) >= limit:
+                    genre_future.cancel()
             
             # Strategy 3: Track-only recommendations (Last.fm similar tracks)
             elif has_tracks:
@@ -156,33 +282,93 @@ class RecommendationEngine:
                     seed_artists, 
                     seed_tracks, 
                     search_limit,
-                    expand_search=expand_search
+                    expand_search=expand_search,
+                    seen_ids=seen_ids
                 )
-                # Filter out excluded tracks
-                lastfm_tracks = [t for t in lastfm_tracks if t.get('id') not in exclude_set]
                 result['tracks'] = lastfm_tracks
                 result['sources']['lastfm'] = len(lastfm_tracks) > 0
             
             # Limit to requested amount
             result['tracks'] = result['tracks'][:limit]
             
-            print(f"✅ Recommendations: {len(result['tracks'])} tracks "
-                  f"(Last.fm: {result['sources']['lastfm']}, "
-                  f"Spotify: {result['sources']['spotify']})")
+            logger.info("Recommendations: %d tracks (Last.fm: %s, Spotify: %s)",
+                        len(result['tracks']), result['sources']['lastfm'], result['sources']['spotify'])
             
         except Exception as e:
-            print(f"Error in recommendation engine: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Error in recommendation engine: %s", e)
+        
+        if cache_key is not None and result['tracks']:
+            _RESULT_CACHE.set(cache_key, copy.deepcopy(result))
         
         return result
     
+    @staticmethod
+    def invalidate(seed_artists: Optional[List[str]] = None, seed_tracks: Optional[List[str]] = None):
+        """
+        Drop cached results for any seed set that includes one of these artists or tracks,
+        e.g. after a user dismisses or deletes recommendations made from them.
+        
+        Args:
+            seed_artists: Spotify artist IDs whose cached recommendations should be refreshed
+            seed_tracks: Spotify track IDs whose cached recommendations should be refreshed
+        """
+        artist_set = frozenset(seed_artists or ())
+        track_set = frozenset(seed_tracks or ())
+        _RESULT_CACHE.remove_if(
+            lambda key: not artist_set.isdisjoint(key[0]) or not track_set.isdisjoint(key[1])
+        )
+    
+    def _strategy_result(self, future, strategy) -> List[Dict]:
+        """
+        Collect the tracks of a Spotify-side strategy: from its speculative
+        future if one was started, otherwise by running it now.
+        
+        Only called when Last.fm came up short, so a started strategy is
+        waited on to completion; its tracks are the ones filling the gap.
+        
+        Args:
+            future: Future returned by _STRATEGY_EXECUTOR.submit, or None
+            strategy: The strategy call, used when no future was started
+        
+        Returns:
+            list: The strategy's tracks, or [] if it failed
+        """
+        try:
+            if future is None:
+                return strategy() or []
+            return future.result() or []
+        except Exception as e:
+            logger.warning("Spotify strategy failed: %s", e)
+        return []
+    
+    def _get_artists(self, artist_ids: List[str]) -> List[Dict]:
+        """
+        Get Spotify artist objects, fetching any not yet cached in one bulk request.
+        
+        These are seed artists, whose genres drive the fallback strategies, so
+        genre-less artists get the search fallback.
+        
+        Args:
+            artist_ids: List of Spotify artist IDs
+        
+        Returns:
+            list: Artist dictionaries for the IDs Spotify knows about, in input order
+        """
+        missing = [aid for aid in artist_ids if aid not in self._artist_info_cache]
+        if missing:
+            for artist in get_artists_bulk(self.spotify_token, missing, genre_fallback=True):
+                if artist and artist.get('id'):
+                    self._artist_info_cache[artist['id']] = artist
+        
+        return [self._artist_info_cache[aid] for aid in artist_ids if aid in self._artist_info_cache]
+    
     def _get_lastfm_recommendations(
         self,
         seed_artists: List[str],
         seed_tracks: List[str],
         limit: int,
-        expand_search: bool = False
+        expand_search: bool = False,
+        seen_ids: Optional[set] = None
     ) -> List[Dict]:
         """
         Get recommendations from Last.fm (primary recommendation engine).
@@ -192,148 +378,141 @@ class RecommendationEngine:
         2. Get top tracks from similar artists
         3. Search Spotify for those tracks to get metadata
         4. Also use similar tracks if seed tracks provided
+        
+        seen_ids, if given, is the caller's set of already-used (or excluded)
+        track IDs; it is skipped here and updated with every track added.
         """
         recommendations = []
-        seen_track_ids = set()
-        
-        # Get artist names from Spotify (parallel)
-        artist_names = []
-        def get_artist_name(artist_id):
-            try:
-                artist_info = get_artist_info(self.spotify_token, artist_id)
-                return artist_info.get('name', '') if artist_info else ''
-            except Exception as e:
-                print(f"Error getting artist info for {artist_id}: {str(e)}")
-                return ''
-        
-        with ThreadPoolExecutor(max_workers=3) as executor:
-            futures = {executor.submit(get_artist_name, aid): aid for aid in seed_artists[:3]}
-            for future in as_completed(futures):
-                name = future.result()
-                if name:
-                    artist_names.append(name)
+        seen_track_ids = seen_ids if seen_ids is not None else set()
+        seed_artist_set = frozenset(seed_artists)
+        # Bound once for the merge loops below
+        seen_add = seen_track_ids.add
+        append = recommendations.append
+        
+        # Get artist names from Spotify (single bulk request)
+        artist_names = [
+            artist['name'] for artist in self._get_artists(seed_artists[:3])
+            if artist.get('name')
+        ]
+        
+        # When expanding, Strategy 3 (genre-based) always runs and only needs the artist
+        # names, so start it now to overlap with Strategies 1 and 2
+        genre_future = None
+        if expand_search and artist_names:
+            genre_future = _STRATEGY_EXECUTOR.submit(
+                self._get_genre_based_recommendations,
+                artist_names,
+                seed_artists,
+                limit * 2,
+                expand_search=True
+            )
         
         # Strategy 1: Similar artists from Last.fm (parallel)
-        def process_artist(artist_name):
-            """Process one artist and return recommendations"""
-            artist_recommendations = []
+        # If expanding, go deeper in the similar-artist list
+        max_similar = 15 if expand_search else 8
+        tracks_per_artist = 8 if expand_search else 5
+        
+        def get_tracks_from_similar(artist_name, similar):
+            similar_name = similar.get('name', '')
+            match_score = similar.get('match', 0)
+            
+            if similar_name.lower() == artist_name.lower():
+                return []
+            
             try:
-                # Get similar artists from Last.fm
-                similar_limit = 20 if expand_search else 10
-                similar_artists = get_similar_artists(artist_name, limit=similar_limit)
-                
-                if not similar_artists:
-                    return artist_recommendations
-                
-                # Sort by match score (highest first)
-                similar_artists.sort(key=lambda x: x.get('match', 0), reverse=True)
-                
-                # If expanding, use more artists and go deeper in the list
-                if expand_search:
-                    artists_to_use = similar_artists[:15]
-                    tracks_per_artist = 8
-                else:
-                    artists_to_use = similar_artists[:8]
-                    tracks_per_artist = 5
-                
-                # Get tracks from similar artists (parallel)
-                def get_tracks_from_similar(similar):
-                    similar_name = similar.get('name', '')
-                    match_score = similar.get('match', 0)
-                    
-                    if similar_name.lower() == artist_name.lower():
-                        return []
-                    
-                    try:
-                        lastfm_tracks = get_lastfm_top_tracks(similar_name, limit=tracks_per_artist)
-                        tracks = []
-                        for track_info in lastfm_tracks:
-                            track_name = track_info.get('name', '')
-                            if not track_name:
-                                continue
-                            
-                            # Search Spotify for this track
-                            spotify_tracks = search_tracks(
-                                self.spotify_token,
-                                f"{track_name} {similar_name}",
-                                limit=2  # Reduced from 3 for speed
-                            )
-                            
-                            for track in spotify_tracks:
-                                track_id = track.get('id')
-                                if not track_id:
-                                    continue
-                                
-                                # Filter out tracks from seed artists
-                                track_artist_ids = []
-                                if 'artists' in track and isinstance(track.get('artists'), list):
-                                    track_artist_ids = [a.get('id') for a in track['artists'] 
-                                                      if isinstance(a, dict) and a.get('id')]
-                                
-                                if not any(aid in seed_artists for aid in track_artist_ids):
-                                    # If track doesn't have preview_url, try to fetch it
-                                    if not track.get('preview_url') and track_id:
-                                        try:
-                                            track_data = get_track(self.spotify_token, track_id)
-                                            if track_data:
-                                                preview_url = track_data.get('preview_url')
-                                                if preview_url:
-                                                    track['preview_url'] = preview_url
-                                        except:
-                                            pass  # Continue even if fetch fails
-                                    
-                                    track['lastfm_match'] = match_score
-                                    tracks.append(track)
-                                    break  # Only add first match
-                        
-                        return tracks
-                    except Exception as e:
-                        print(f"Error getting tracks for {similar_name}: {str(e)}")
-                        return []
-                
-                # Process similar artists in parallel (but limit concurrency)
-                with ThreadPoolExecutor(max_workers=5) as executor:
-                    futures = {executor.submit(get_tracks_from_similar, similar): similar 
-                              for similar in artists_to_use}
-                    for future in as_completed(futures):
-                        tracks = future.result()
-                        artist_recommendations.extend(tracks)
-                
+                lastfm_tracks = get_lastfm_top_tracks(similar_name, limit=tracks_per_artist)
+                tracks = self._find_artist_tracks(
+                    similar_name,
+                    [track_info.get('name', '') for track_info in lastfm_tracks],
+                    seed_artist_set
+                )
+                # Missing preview URLs are backfilled in one bulk request at the end
+                for track in tracks:
+                    track['lastfm_match'] = match_score
+                return tracks
             except Exception as e:
-                print(f"Error getting Last.fm recommendations for {artist_name}: {str(e)}")
+                logger.warning("Error getting tracks for %s: %s", similar_name, e)
+                return []
+        
+        if artist_names:
+            # Split the limit across seed artists so no artist fans out far past its share
+            budget = max(5, math.ceil(limit / len(artist_names)))
+            # Hedge against slow lookups: dispatch a few more similar artists than we need
+            # per seed and stop once as many lookups as needed have returned tracks
+            needed = min(max_similar, budget * 2)
+            per_seed = needed + math.ceil(needed * _HEDGE_RATIO)
+            similar_limit = max(20 if expand_search else 10, per_seed)
             
-            return artist_recommendations
-        
-        # Process all artists in parallel (only if we have artists)
-        if len(artist_names) > 0:
-            max_workers = max(1, min(len(artist_names), 3))  # Ensure at least 1 worker
-            with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                futures = {executor.submit(process_artist, name): name for name in artist_names}
-                for future in as_completed(futures):
-                    artist_recs = future.result()
-                    for track in artist_recs:
+            # Fan out to each similar artist as soon as its seed's similar-artist list arrives
+            similar_futures = {
+                _IO_EXECUTOR.submit(get_similar_artists, name, limit=similar_limit): name
+                for name in artist_names
+            }
+            track_futures = {}
+            for future in as_completed(similar_futures):
+                artist_name = similar_futures[future]
+                try:
+                    similar_artists = future.result()
+                except Exception as e:
+                    logger.warning("Error getting Last.fm recommendations for %s: %s", artist_name, e)
+                    continue
+                strong = [s for s in similar_artists if s.get('match', 0) >= _MIN_MATCH]
+                if len(strong) < len(similar_artists):
+                    logger.debug("Skipped %d weak similar artists for %s (match < %s)",
+                                 len(similar_artists) - len(strong), artist_name, _MIN_MATCH)
+                # Highest match first
+                for similar in _top_artists_by_match(strong, per_seed):
+                    track_futures[_IO_EXECUTOR.submit(get_tracks_from_similar, artist_name, similar)] = artist_name
+            
+            contributed = dict.fromkeys(artist_names, 0)
+            # Empty lookups (no Last.fm top tracks, nothing on Spotify) don't count,
+            # so fast misses can't end the wait before slower lookups deliver
+            quorum = max(1, round(len(track_futures) / (1 + _HEDGE_RATIO)))
+            productive = 0
+            try:
+                for future in as_completed(track_futures):
+                    if future.cancelled():
+                        continue
+                    artist_name = track_futures[future]
+                    if contributed[artist_name] >= budget:
+                        continue
+                    tracks = future.result()
+                    if not tracks:
+                        continue
+                    productive += 1
+                    contributed[artist_name] += len(tracks)
+                    for track in tracks:
                         track_id = track.get('id')
                         if track_id and track_id not in seen_track_ids:
-                            seen_track_ids.add(track_id)
-                            recommendations.append(track)
+                            seen_add(track_id)
+                            append(track)
                             if len(recommendations) >= limit:
                                 break
-                    if len(recommendations) >= limit:
+                    if len(recommendations) >= limit or productive >= quorum:
                         break
+                    if contributed[artist_name] >= budget:
+                        # This artist has contributed its share; skip its unstarted lookups
+                        for pending, name in track_futures.items():
+                            if name == artist_name:
+                                pending.cancel()
+            finally:
+                for pending in track_futures:
+                    pending.cancel()
         
-        print(f"Last.fm found {len(recommendations)} recommendations from similar artists")
+        logger.debug("Last.fm found %d recommendations from similar artists", len(recommendations))
         
         # Strategy 2: Similar tracks from Last.fm (if seed tracks provided)
         # If expanding, use more seed tracks
         max_seed_tracks = 5 if expand_search else 3
         if seed_tracks and len(recommendations) < limit:
+            # Get track info for all seed tracks from Spotify in one request
+            seed_track_data = get_tracks_bulk(self.spotify_token, seed_tracks[:max_seed_tracks])
             for track_id in seed_tracks[:max_seed_tracks]:
                 if len(recommendations) >= limit:
                     break
                 
                 try:
-                    # Get track info from Spotify
-                    track_data = get_track(self.spotify_token, track_id)
+                    track_data = seed_track_data.get(track_id)
                     
                     if track_data:
                         track_name = track_data.get('name', '')
@@ -381,41 +560,113 @@ class RecommendationEngine:
                                         break
                 
                 except Exception as e:
-                    print(f"Error getting similar tracks for {track_id}: {str(e)}")
+                    logger.warning("Error getting similar tracks for %s: %s", track_id, e)
         
         # Strategy 3: Genre-based recommendations from Last.fm
         # Always use genre-based if expanding search or if not enough tracks
-        if (expand_search or len(recommendations) < limit) and artist_names:
-            genre_limit = (limit - len(recommendations)) * 2 if expand_search else (limit - len(recommendations))
-            genre_tracks = self._get_genre_based_recommendations(
+        if genre_future:
+            try:
+                genre_tracks = genre_future.result()
+            except Exception as e:
+                logger.warning("Genre-based recommendations failed: %s", e)
+                genre_tracks = []
+            recommendations.extend(itertools.islice(_new_tracks(genre_tracks, seen_track_ids),
+                                                    (limit - len(recommendations)) * 2))
+        elif len(recommendations) < limit and artist_names:
+            # Shares the seen set, so its tracks are already deduplicated
+            recommendations.extend(self._get_genre_based_recommendations(
                 artist_names, 
                 seed_artists, 
-                genre_limit,
-                expand_search=expand_search
+                limit - len(recommendations),
+                expand_search=expand_search,
+                seen_ids=seen_track_ids
+            ))
+        
+        # Keep the best `limit` tracks by Last.fm match score (if available)
+        recommendations = heapq.nlargest(limit, recommendations, key=lambda x: x.get('lastfm_match', 0))
+        
+        self._backfill_preview_urls(recommendations)
+        return recommendations
+    
+    def _find_artist_tracks(
+        self,
+        artist_name: str,
+        track_names: List[str],
+        seed_artist_set: frozenset
+    ) -> List[Dict]:
+        """
+        Find Spotify tracks for Last.fm track titles by one artist.
+        
+        One catalog search for the artist covers most titles; only titles it
+        misses fall back to a per-track Spotify search.
+        
+        Args:
+            artist_name: Artist the titles belong to
+            track_names: Last.fm track titles
+            seed_artist_set: Seed artist IDs whose tracks are skipped
+        
+        Returns:
+            list: The first non-seed Spotify match for each title that was found
+        """
+        track_names = [name for name in track_names if name]
+        if not track_names:
+            return []
+        
+        catalog = {}
+        for track in search_artist_catalog(self.spotify_token, artist_name):
+            catalog.setdefault(_track_key(track.get('name', '')), track)
+        
+        tracks = []
+        for track_name in track_names:
+            match = catalog.get(_track_key(track_name))
+            candidates = [match] if match else search_tracks(
+                self.spotify_token,
+                f"{track_name} {artist_name}",
+                limit=2  # Reduced from 3 for speed
             )
-            for track in genre_tracks:
-                track_id = track.get('id')
-                if track_id and track_id not in seen_track_ids:
-                    seen_track_ids.add(track_id)
-                    recommendations.append(track)
+            for track in candidates:
+                # Filter out tracks from seed artists
+                if track.get('id') and seed_artist_set.isdisjoint(_track_artist_ids(track)):
+                    tracks.append(track)
+                    break  # Only add first match
         
-        # Sort by Last.fm match score if available
-        recommendations.sort(key=lambda x: x.get('lastfm_match', 0), reverse=True)
+        return tracks
+    
+    def _backfill_preview_urls(self, tracks: List[Dict]):
+        """
+        Fill in missing preview URLs from the full track objects, using one
+        bulk lookup per 50 tracks instead of a request per track.
         
-        return recommendations[:limit]
+        Args:
+            tracks: Track dictionaries to update in place
+        """
+        missing = [track['id'] for track in tracks if not track.get('preview_url') and track.get('id')]
+        if not missing:
+            return
+        
+        full_tracks = get_tracks_bulk(self.spotify_token, missing)
+        for track in tracks:
+            preview_url = full_tracks.get(track.get('id'), {}).get('preview_url')
+            if preview_url and not track.get('preview_url'):
+                track['preview_url'] = preview_url
     
     def _get_genre_based_recommendations(
         self,
         artist_names: List[str],
         seed_artists: List[str],
         limit: int,
-        expand_search: bool = False
+        expand_search: bool = False,
+        seen_ids: Optional[set] = None
     ) -> List[Dict]:
         """
         Get genre-based recommendations using Last.fm tags.
+        
+        seen_ids, if given, is a shared set of track IDs to skip; it is
+        updated with every track added.
         """
         recommendations = []
-        seen_track_ids = set()
+        seen_track_ids = seen_ids if seen_ids is not None else set()
+        seed_artist_set = frozenset(seed_artists)
         
         # Get top tags (genres) from Last.fm
         all_tags = []
@@ -423,107 +674,89 @@ class RecommendationEngine:
         artists_to_check = artist_names[:3] if expand_search else artist_names[:2]
         tags_per_artist = 8 if expand_search else 5
         
-        for artist_name in artists_to_check:
-            tags = get_artist_tags(artist_name, limit=tags_per_artist)
-            for tag in tags:
-                tag_name = tag.get('name', '').lower()
-                # Filter out non-genre tags
-                if tag_name and tag_name not in ['seen live', 'favorites', 'favourite', 'seen', 'live', 'my music']:
-                    all_tags.append(tag_name)
+        # map keeps the seed-artist order, so tags stay ranked
+        for tags in _IO_EXECUTOR.map(lambda name: get_artist_tags(name, limit=tags_per_artist), artists_to_check):
+            # Filter out non-genre tags
+            all_tags.extend(
+                tag_name for tag in tags
+                if (tag_name := tag.get('name', '').casefold())
+                and tag_name not in _NON_GENRE_TAGS
+            )
         
-        # Get unique tags (more if expanding)
+        # Get unique tags (more if expanding), keeping Last.fm's ranking order
         max_tags = 5 if expand_search else 3
-        unique_tags = list(set(all_tags))[:max_tags]
+        unique_tags = list(dict.fromkeys(all_tags))[:max_tags]
 
         # If we couldn't get any tags from Last.fm (e.g., API 403 or empty data),
         # just return an empty list and let the caller fall back to Spotify-only logic.
         if not unique_tags:
-            print("Last.fm genre-based recommendations: no tags found, skipping genre step")
+            logger.debug("Last.fm genre-based recommendations: no tags found, skipping genre step")
             return []
         
-        # Process genres in parallel
-        def process_genre(tag):
-            """Process one genre and return recommendations"""
-            genre_recommendations = []
+        # Get top artists for each tag (more if expanding), then tracks for each artist
+        artists_limit = 20 if expand_search else 10
+        # Hedge against slow lookups: dispatch a few more artists than we need per tag
+        # and stop once as many lookups as needed have returned tracks
+        needed_per_tag = 10 if expand_search else 5
+        artists_per_tag = needed_per_tag + math.ceil(needed_per_tag * _HEDGE_RATIO)
+        tracks_limit = 5 if expand_search else 3
+        
+        def get_tracks_from_genre_artist(artist_info):
+            artist_name = artist_info.get('name', '')
+            if not artist_name:
+                return []
+            
             try:
-                # Get top artists for this tag (more if expanding)
-                artists_limit = 20 if expand_search else 10
-                top_artists = get_tag_top_artists(tag, limit=artists_limit)
-                
-                # Use more artists if expanding
-                artists_to_use = top_artists[:10] if expand_search else top_artists[:5]
-                
-                # Process artists in parallel
-                def get_tracks_from_genre_artist(artist_info):
-                    artist_name = artist_info.get('name', '')
-                    if not artist_name:
-                        return []
-                    
-                    try:
-                        tracks_limit = 5 if expand_search else 3
-                        lastfm_tracks = get_lastfm_top_tracks(artist_name, limit=tracks_limit)
-                        tracks = []
-                        
-                        for track_info in lastfm_tracks:
-                            track_name = track_info.get('name', '')
-                            if not track_name:
-                                continue
-                            
-                            # Search Spotify
-                            spotify_tracks = search_tracks(
-                                self.spotify_token,
-                                f"{track_name} {artist_name}",
-                                limit=2
-                            )
-                            
-                            for track in spotify_tracks:
-                                track_id = track.get('id')
-                                if not track_id:
-                                    continue
-                                
-                                # Filter out seed artists
-                                track_artist_ids = []
-                                if 'artists' in track and isinstance(track.get('artists'), list):
-                                    track_artist_ids = [a.get('id') for a in track['artists'] 
-                                                      if isinstance(a, dict) and a.get('id')]
-                                
-                                if not any(aid in seed_artists for aid in track_artist_ids):
-                                    tracks.append(track)
-                                    break  # Only add first match
-                        
-                        return tracks
-                    except Exception as e:
-                        print(f"Error getting tracks for genre artist {artist_name}: {str(e)}")
-                        return []
-                
-                # Process artists in parallel
-                with ThreadPoolExecutor(max_workers=5) as executor:
-                    futures = {executor.submit(get_tracks_from_genre_artist, artist_info): artist_info 
-                              for artist_info in artists_to_use}
-                    for future in as_completed(futures):
-                        tracks = future.result()
-                        genre_recommendations.extend(tracks)
-                
+                lastfm_tracks = get_lastfm_top_tracks(artist_name, limit=tracks_limit)
+                return self._find_artist_tracks(
+                    artist_name,
+                    [track_info.get('name', '') for track_info in lastfm_tracks],
+                    seed_artist_set
+                )
             except Exception as e:
-                print(f"Error in genre-based recommendations for tag {tag}: {str(e)}")
-            
-            return genre_recommendations
+                logger.warning("Error getting tracks for genre artist %s: %s", artist_name, e)
+                return []
         
-        # Process all genres in parallel (ensure max_workers >= 1)
-        max_workers = max(1, min(len(unique_tags), 3))
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = {executor.submit(process_genre, tag): tag for tag in unique_tags}
-            for future in as_completed(futures):
-                genre_recs = future.result()
-                for track in genre_recs:
+        tag_futures = {
+            _IO_EXECUTOR.submit(get_tag_top_artists, tag, limit=artists_limit): tag
+            for tag in unique_tags
+        }
+        track_futures = []
+        for future in as_completed(tag_futures):
+            try:
+                top_artists = future.result()
+            except Exception as e:
+                logger.warning("Error in genre-based recommendations for tag %s: %s", tag_futures[future], e)
+                continue
+            track_futures.extend(
+                _IO_EXECUTOR.submit(get_tracks_from_genre_artist, artist_info)
+                for artist_info in _top_artists_by_match(top_artists, artists_per_tag)
+            )
+        
+        seen_add = seen_track_ids.add
+        append = recommendations.append
+        # Empty lookups don't count toward the quorum, so fast misses can't cut off
+        # slower lookups that find tracks
+        quorum = max(1, round(len(track_futures) / (1 + _HEDGE_RATIO)))
+        productive = 0
+        try:
+            for future in as_completed(track_futures):
+                tracks = future.result()
+                if not tracks:
+                    continue
+                productive += 1
+                for track in tracks:
                     track_id = track.get('id')
                     if track_id and track_id not in seen_track_ids:
-                        seen_track_ids.add(track_id)
-                        recommendations.append(track)
+                        seen_add(track_id)
+                        append(track)
                         if len(recommendations) >= limit:
                             break
-                if len(recommendations) >= limit:
+                if len(recommendations) >= limit or productive >= quorum:
                     break
+        finally:
+            for pending in track_futures:
+                pending.cancel()
         
         return recommendations
     
@@ -531,15 +764,19 @@ class RecommendationEngine:
         self,
         seed_genres: List[str],
         limit: int,
-        expand_search: bool = False
+        expand_search: bool = False,
+        seen_ids: Optional[set] = None
     ) -> List[Dict]:
         """
         Get recommendations based solely on genres/categories using Spotify search.
         This method works when only genres are selected (no artists or tracks).
         Searches Spotify for tracks matching ANY of the selected genres.
+        
+        seen_ids, if given, is a shared set of track IDs to skip; it is
+        updated with every track added.
         """
         recommendations = []
-        seen_track_ids = set()
+        seen_track_ids = seen_ids if seen_ids is not None else set()
         
         # Normalize genre names (handle categories that might be formatted differently)
         normalized_genres = []
@@ -567,99 +804,72 @@ class RecommendationEngine:
             normalized_genre = category_map.get(genre_lower, genre_lower)
             normalized_genres.append(normalized_genre)
         
-        print(f"Searching Spotify for genres: {normalized_genres}")
+        logger.debug("Searching Spotify for genres: %s", normalized_genres)
+        
+        # Aim for an even share per genre plus headroom for duplicates (double if expanding)
+        tracks_per_genre = (limit // len(normalized_genres)) + 10 if normalized_genres else limit
+        if expand_search:
+            tracks_per_genre = tracks_per_genre * 2
         
-        # Search Spotify for each genre and combine results
-        def search_genre(genre_name):
-            """Search Spotify for tracks in a specific genre"""
-            genre_tracks = []
+        def search(query, search_limit):
             try:
-                # Search for tracks using genre as keyword
-                # Try multiple search strategies to get diverse results
-                search_queries = [
-                    genre_name,  # Simple genre name
-                    f"genre:{genre_name}",  # Genre filter (if supported)
-                    f"tag:{genre_name}",  # Tag filter (if supported)
-                ]
-                
-                # Use the first query that works, or combine results
-                tracks_per_genre = (limit // len(normalized_genres)) + 10 if normalized_genres else limit
-                if expand_search:
-                    tracks_per_genre = tracks_per_genre * 2
-                
-                # Search with genre name as keyword
-                search_results = search_tracks(
-                    self.spotify_token,
-                    genre_name,
-                    limit=min(tracks_per_genre, 50)
-                )
+                return search_tracks(self.spotify_token, query, limit=search_limit)
+            except Exception as e:
+                logger.warning("Error searching for %s: %s", query, e)
+                return []
+        
+        # First wave: search with each genre name as keyword, all genres in parallel
+        base_futures = {
+            _IO_EXECUTOR.submit(search, genre, min(tracks_per_genre, 50)): genre
+            for genre in normalized_genres
+        }
+        wave_futures = []
+        try:
+            for future in as_completed(base_futures):
+                genre_name = base_futures[future]
+                genre_tracks = [track for track in future.result() if track.get('id')]
+                logger.debug("Found %d tracks for genre '%s'", len(genre_tracks), genre_name)
                 
-                # Add initial search results
-                for track in search_results:
-                    track_id = track.get('id')
-                    if track_id:
-                        genre_tracks.append(track)
+                recommendations.extend(itertools.islice(_new_tracks(genre_tracks, seen_track_ids),
+                                                        limit - len(recommendations)))
+                if len(recommendations) >= limit:
+                    break
                 
-                # Also try searching for popular tracks with genre in the query
-                if len(genre_tracks) < tracks_per_genre:
-                    # Try searching for "popular [genre]" or "[genre] music"
+                # Second wave: if the genre came up short, queue just enough "[genre] music",
+                # "popular [genre]", "best [genre]" searches (20 results each) to fill it
+                missing = tracks_per_genre - len(genre_tracks)
+                if missing > 0:
                     additional_queries = [
                         f"{genre_name} music",
                         f"popular {genre_name}",
                         f"best {genre_name}"
                     ]
-                    existing_ids = {t.get('id') for t in genre_tracks}
-                    for query in additional_queries:
-                        if len(genre_tracks) >= tracks_per_genre:
-                            break
-                        try:
-                            more_results = search_tracks(
-                                self.spotify_token,
-                                query,
-                                limit=min(20, tracks_per_genre - len(genre_tracks))
-                            )
-                            # Add unique tracks
-                            for track in more_results:
-                                track_id = track.get('id')
-                                if track_id and track_id not in existing_ids:
-                                    genre_tracks.append(track)
-                                    existing_ids.add(track_id)
-                        except Exception as e:
-                            print(f"Error in additional search for {query}: {str(e)}")
-                            continue
-                
-                print(f"Found {len(genre_tracks)} tracks for genre '{genre_name}'")
-                
-            except Exception as e:
-                print(f"Error searching for genre {genre_name}: {str(e)}")
-                import traceback
-                traceback.print_exc()
+                    wave_futures.extend(
+                        _IO_EXECUTOR.submit(search, query, min(20, missing))
+                        for query in additional_queries[:math.ceil(missing / 20)]
+                    )
             
-            return genre_tracks
-        
-        # Search all genres in parallel
-        if len(normalized_genres) > 0:
-            max_workers = max(1, min(len(normalized_genres), 5))
-            with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                futures = {executor.submit(search_genre, genre): genre for genre in normalized_genres}
-                for future in as_completed(futures):
-                    genre_tracks = future.result()
-                    for track in genre_tracks:
-                        track_id = track.get('id')
-                        if track_id and track_id not in seen_track_ids:
-                            seen_track_ids.add(track_id)
-                            recommendations.append(track)
-                            if len(recommendations) >= limit:
-                                break
+            if len(recommendations) < limit:
+                for future in as_completed(wave_futures):
+                    recommendations.extend(itertools.islice(_new_tracks(future.result(), seen_track_ids),
+                                                            limit - len(recommendations)))
                     if len(recommendations) >= limit:
                         break
-        
-        # Shuffle to mix genres (optional - can be removed if you want genre grouping)
-        import random
-        random.shuffle(recommendations)
-        
-        print(f"Found {len(recommendations)} total tracks from genre-only recommendations")
-        return recommendations[:limit]
+        finally:
+            # Stop waiting on the remaining searches; drop any not yet started
+            for pending in itertools.chain(base_futures, wave_futures):
+                pending.cancel()
+        
+        # Shuffle to mix genres (optional - can be removed if you want genre grouping).
+        # Partial Fisher-Yates: only the first `limit` slots need to be randomized.
+        n = len(recommendations)
+        k = min(limit, n)
+        for i in range(k):
+            j = self._rng.randrange(i, n)
+            recommendations[i], recommendations[j] = recommendations[j], recommendations[i]
+        
+        logger.debug("Found %d total tracks from genre-only recommendations", n)
+        return recommendations[:k]
     
     def _get_spotify_fallback_recommendations(
         self,
@@ -673,45 +883,77 @@ class RecommendationEngine:
         """
         recommendations = []
         seen_track_ids = set()
+        seed_artist_set = frozenset(seed_artists)
         
         # Get genres from seed artists (more if expanding)
         genres = []
         artists_to_check = seed_artists[:3] if expand_search else seed_artists[:2]
         genres_per_artist = 3 if expand_search else 2
         
-        for artist_id in artists_to_check:
-            try:
-                artist_genres = get_artist_genres(self.spotify_token, artist_id)
-                genres.extend(artist_genres[:genres_per_artist])
-            except:
-                pass
+        # Artist objects (with genres) come from the per-request cache filled by one bulk request
+        for artist in self._get_artists(artists_to_check):
+            genres.extend(artist.get('genres', [])[:genres_per_artist])
         
         # Use more genres if expanding
         max_genres = 5 if expand_search else 3
-        genres = list(set(genres))[:max_genres]
+        genres = list(dict.fromkeys(genres))[:max_genres]
         
         # Search by genre (more results if expanding)
         tracks_per_genre = 40 if expand_search else 20
-        for genre in genres:
-            if len(recommendations) >= limit:
-                break
+        
+        def search_genre(query, search_limit):
             try:
-                tracks = search_tracks(self.spotify_token, f'genre:"{genre}" year:2020-2024', limit=tracks_per_genre)
-                for track in tracks:
-                    track_id = track.get('id')
-                    if track_id and track_id not in seen_track_ids:
-                        track_artist_ids = []
-                        if 'artists' in track and isinstance(track.get('artists'), list):
-                            track_artist_ids = [a.get('id') for a in track['artists'] 
-                                              if isinstance(a, dict) and a.get('id')]
-                        
-                        if not any(aid in seed_artists for aid in track_artist_ids):
-                            seen_track_ids.add(track_id)
-                            recommendations.append(track)
-                            if len(recommendations) >= limit:
-                                break
+                return search_tracks(self.spotify_token, query, limit=search_limit)
             except Exception as e:
-                print(f"Error in Spotify fallback for genre {genre}: {str(e)}")
+                logger.warning("Error in Spotify fallback search %s: %s", query, e)
+                return []
+        
+        # Bind hot-loop lookups once
+        seen_add = seen_track_ids.add
+        append = recommendations.append
+        
+        def merge(tracks):
+            """Add new non-seed tracks; returns True once the limit is reached"""
+            for track in tracks:
+                track_id = track.get('id')
+                if track_id and track_id not in seen_track_ids:
+                    track_artist_ids = _track_artist_ids(track)
+                    
+                    if seed_artist_set.isdisjoint(track_artist_ids):
+                        seen_add(track_id)
+                        append(track)
+                        if len(recommendations) >= limit:
+                            return True
+            return False
+        
+        if not genres:
+            return recommendations
+        
+        # Exclude seed artists in the query itself so their tracks don't use up
+        # result slots (merge() still filters, in case the operator is ignored)
+        exclusions = ''.join(
+            f' NOT artist:"{artist["name"]}"'
+            for artist in self._get_artists(seed_artists[:3])
+            if artist.get('name')
+        )
+        
+        # Filters shared by every query below, built once
+        filters = f' {_RECENT_YEARS}{exclusions}'
+        
+        # One query per genre, in parallel: Spotify search has no grouping, so in an
+        # OR-combined query the year and NOT filters would bind to the last genre only
+        futures = [
+            _IO_EXECUTOR.submit(search_genre, f'genre:"{genre}"{filters}', tracks_per_genre)
+            for genre in genres
+        ]
+        try:
+            for future in as_completed(futures):
+                if merge(future.result()):
+                    break
+        finally:
+            # Drop searches that haven't started
+            for pending in futures:
+                pending.cancel()
         
         return recommendations
 
@@ -1,40 +1,207 @@
 
 import unittest
-from unittest.mock import MagicMock, patch
-import requests
+from unittest.mock import patch
 import sys
 import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 # Add Back-end to path
 sys.path.append(os.path.join(os.getcwd(), 'Back-end'))
 
+import lastfm_api
+import spotify_api
 from spotify_api import _make_spotify_request
+import recommendation_engine
+from rate_limiter import TokenBucket
+from api_cache import clear_all_caches
 
-class TestRateLimit(unittest.TestCase):
-    @patch('spotify_api.requests.get')
-    @patch('spotify_api.time.sleep')
-    def test_rate_limit_retry(self, mock_sleep, mock_get):
-        # Setup mock to return 429 twice, then 200
-        response_429 = MagicMock()
-        response_429.status_code = 429
-        response_429.headers = {'Retry-After': '1'}
-        
-        response_200 = MagicMock()
-        response_200.status_code = 200
-        response_200.json.return_value = {'success': True}
-        
-        mock_get.side_effect = [response_429, response_429, response_200]
-        
-        # Call the function
-        print("Testing rate limit retry...")
-        response = _make_spotify_request('http://example.com', {}, max_retries=3)
-        
-        # Verify
+
+class StubSpotify:
+    """
+    Local HTTP server that answers each request with the next scripted
+    (status, headers) pair, repeating the last one once the script runs out.
+    """
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.hits = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _respond(self):
+                stub.hits += 1
+                status, headers = stub.script[min(stub.hits, len(stub.script)) - 1]
+                body = b'' if status == 304 else b'{"ok": true}'
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = do_PUT = do_POST = _respond
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}/v1/test'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class CacheIsolatedTestCase(unittest.TestCase):
+    """
+    Start every test with empty API caches (ETag, per-ID lookups, tokens)
+    so results cached by one test can't leak into the next.
+    """
+
+    def setUp(self):
+        clear_all_caches()
+
+
+class TestRealAdapter(CacheIsolatedTestCase):
+    """
+    Drive _make_spotify_request through the session's mounted HTTPAdapter
+    (its urllib3 Retry included) against a local stub server.
+    """
+
+    def setUp(self):
+        super().setUp()
+        # The stub speaks plain HTTP; route it through the adapter mounted for https://
+        adapters = patch.dict(spotify_api._SESSION.adapters,
+                              {'http://': spotify_api._SESSION.adapters['https://']})
+        adapters.start()
+        self.addCleanup(adapters.stop)
+        limiter = patch('spotify_api._SPOTIFY_LIMITER', TokenBucket(rate=100, capacity=100))
+        limiter.start()
+        self.addCleanup(limiter.stop)
+        self.slots = spotify_api._SPOTIFY_CONCURRENCY._value
+
+    def serve(self, *script):
+        stub = StubSpotify(script)
+        self.addCleanup(stub.close)
+        return stub
+
+    def test_rate_limit_retry(self):
+        # Two 429s, then 200: each 429 should cost one (mocked) cooldown sleep
+        stub = self.serve((429, {'Retry-After': '1'}), (429, {'Retry-After': '1'}), (200, {}))
+        with patch('spotify_api.time.sleep') as mock_sleep:
+            response = _make_spotify_request(stub.url, {}, max_retries=3)
         self.assertIsNotNone(response)
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(mock_get.call_count, 3)
+        self.assertEqual(stub.hits, 3)
         self.assertEqual(mock_sleep.call_count, 2)
-        print("✅ Rate limit retry worked as expected!")
+
+    def test_long_retry_after_fails_fast(self):
+        stub = self.serve((429, {'Retry-After': '60'}))
+        started = time.monotonic()
+        response = _make_spotify_request(stub.url, {}, silent=True)
+        self.assertIsNone(response)
+        self.assertLess(time.monotonic() - started, 2)
+        # urllib3 must not have retried (or slept through) the 429 itself
+        self.assertEqual(stub.hits, 1)
+        self.assertGreater(spotify_api._SPOTIFY_LIMITER.cooldown_remaining(), 50)
+        self.assertEqual(spotify_api._SPOTIFY_CONCURRENCY._value, self.slots)
+
+    def test_short_retry_after_waits_out_cooldown(self):
+        stub = self.serve((429, {'Retry-After': '1'}), (200, {}))
+        started = time.monotonic()
+        response = _make_spotify_request(stub.url, {}, silent=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(stub.hits, 2)
+        self.assertGreaterEqual(time.monotonic() - started, 1)
+
+    def test_server_errors_back_off_outside_semaphore(self):
+        stub = self.serve((503, {}), (503, {}), (200, {}))
+        slots_while_sleeping = []
+        with patch('spotify_api.time.sleep',
+                   side_effect=lambda _: slots_while_sleeping.append(spotify_api._SPOTIFY_CONCURRENCY._value)):
+            response = _make_spotify_request(stub.url, {}, silent=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(stub.hits, 3)
+        self.assertEqual(slots_while_sleeping, [self.slots, self.slots])
+
+    def test_etag_cache_stores_parsed_body(self):
+        stub = self.serve((200, {'ETag': '"v1"'}), (304, {}))
+        first = _make_spotify_request(stub.url, {})
+        second = _make_spotify_request(stub.url, {})
+        self.assertEqual(stub.hits, 2)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json(), first.json())
+        etag, body = spotify_api._ETAG_CACHE.get((None, stub.url, None))
+        self.assertEqual((etag, body), ('"v1"', {'ok': True}))
+
+    def test_revalidate_false_skips_etag_cache(self):
+        stub = self.serve((200, {'ETag': '"v1"'}))
+        _make_spotify_request(stub.url, {}, revalidate=False)
+        self.assertIsNone(spotify_api._ETAG_CACHE.get((None, stub.url, None)))
+
+    def test_post_is_not_replayed(self):
+        stub = self.serve((503, {}), (200, {}))
+        response = _make_spotify_request(stub.url, {}, method='POST', silent=True)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(stub.hits, 1)
+
+
+class TestLastfmAdapter(CacheIsolatedTestCase):
+    def test_retry_after_goes_to_limiter(self):
+        stub = StubSpotify([(429, {'Retry-After': '60'})])
+        self.addCleanup(stub.close)
+        with patch.dict(lastfm_api._SESSION.adapters, {'http://': lastfm_api._SESSION.adapters['https://']}), \
+                patch('lastfm_api._LASTFM_LIMITER', TokenBucket(rate=5, capacity=5)), \
+                patch('lastfm_api.LASTFM_API_BASE_URL', stub.url), \
+                patch('lastfm_api.LASTFM_API_KEY', 'test'):
+            started = time.monotonic()
+            self.assertEqual(lastfm_api._make_lastfm_request('artist.getSimilar', {}), {})
+            self.assertLess(time.monotonic() - started, 2)
+            self.assertEqual(stub.hits, 1)
+            self.assertGreater(lastfm_api._LASTFM_LIMITER.cooldown_remaining(), 50)
+
+
+
+class TestRecommendationEngine(CacheIsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.engine = recommendation_engine.RecommendationEngine('token')
+        artists = patch.object(self.engine, '_get_artists', return_value=[])
+        artists.start()
+        self.addCleanup(artists.stop)
+
+    def test_slow_fallback_fills_in_when_lastfm_is_empty(self):
+        tracks = [{'id': f't{i}', 'name': f'Track {i}'} for i in range(20)]
+
+        def slow_fallback(*args, **kwargs):
+            time.sleep(2.5)
+            return tracks
+
+        with patch.object(self.engine, '_get_lastfm_recommendations', return_value=[]), \
+                patch.object(self.engine, '_get_spotify_fallback_recommendations', side_effect=slow_fallback):
+            result = self.engine.get_recommendations(seed_artists=['a1'], limit=20)
+        self.assertEqual([t['id'] for t in result['tracks']], [t['id'] for t in tracks])
+        self.assertTrue(result['sources']['spotify'])
+
+    def test_invalidate_drops_cached_results_for_seed(self):
+        tracks = [{'id': f't{i}', 'name': f'Track {i}'} for i in range(5)]
+        with patch.object(self.engine, '_get_lastfm_recommendations', return_value=tracks) as lastfm, \
+                patch.object(self.engine, '_get_spotify_fallback_recommendations', return_value=[]):
+            self.engine.get_recommendations(seed_artists=['a1', 'a2'], limit=5)
+            self.engine.get_recommendations(seed_artists=['a1', 'a2'], limit=5)
+            self.assertEqual(lastfm.call_count, 1)
+
+            recommendation_engine.RecommendationEngine.invalidate(['a3'])
+            self.engine.get_recommendations(seed_artists=['a1', 'a2'], limit=5)
+            self.assertEqual(lastfm.call_count, 1)
+
+            recommendation_engine.RecommendationEngine.invalidate(['a2'])
+            self.engine.get_recommendations(seed_artists=['a1', 'a2'], limit=5)
+            self.assertEqual(lastfm.call_count, 2)
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,52 @@
+"""
+Request Coalescing
+Lets concurrent callers asking for the same thing share a single in-flight
+API call instead of each issuing their own
+"""
+
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time; concurrent callers with the
+    same key wait for and receive the first caller's result (or exception).
+    """
+
+    def __init__(self):
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func, *args, **kwargs):
+        """
+        Call func(*args, **kwargs), or join an identical call already in flight.
+
+        Args:
+            key: Hashable identifying the call
+            func: Function to run if no call with this key is in flight
+
+        Returns:
+            The result of the (shared) call
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._inflight[key]
@@ -3,16 +3,126 @@ Spotify API Helper Functions
 Handles all interactions with the Spotify Web API
 """
 
+import functools
+import logging
+import os
+import random
 import requests
+import threading
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
+from urllib.parse import quote, urlencode
 from flask import current_app
 
+from rate_limiter import TokenBucket
+from json_utils import response_json
+from api_cache import TTLCache, ttl_cache
+
+logger = logging.getLogger(__name__)
+
+# Spotify endpoints
+SPOTIFY_TOKEN_URL = 'https://accounts.spotify.com/api/token'
+SPOTIFY_API_BASE_URL = 'https://api.spotify.com/v1'
+
 # Cache for client credentials token (valid for 1 hour)
 _app_token_cache = {
     'token': None,
     'expires_at': None
 }
+_APP_TOKEN_LOCK = threading.Lock()
+
+# Recently validated user access tokens, keyed by user ID, as (token, expires_at),
+# so requests with a still-valid token skip the ORM and expiry check
+_USER_TOKEN_CACHE = TTLCache(maxsize=10_000, ttl=55 * 60)
+
+# Striped locks serializing token refreshes per user (bounded, unlike one lock per user)
+_USER_REFRESH_LOCKS = tuple(threading.Lock() for _ in range(64))
+
+# Client-side pacing for all Spotify Web API calls (150 requests per minute)
+# so the recommendation fan-out doesn't trigger 429s
+_SPOTIFY_LIMITER = TokenBucket(rate=150 / 60, capacity=150)
+
+# Cap on simultaneous in-flight Spotify requests across all worker threads
+# (set SPOTIFY_MAX_CONCURRENCY to tune)
+_SPOTIFY_CONCURRENCY = threading.BoundedSemaphore(int(os.environ.get('SPOTIFY_MAX_CONCURRENCY', 5)))
+
+# Shared keep-alive session: reuses TCP/TLS connections to api.spotify.com and
+# accounts.spotify.com instead of opening a new one for every call. urllib3 keeps
+# a separate pool per host; Authorization is set per request since tokens differ.
+#
+# The adapter only retries failed connection attempts, immediately: the request
+# never reached Spotify, so this is safe for any method (including token POSTs)
+# and never sleeps. 429s, 5xx responses and read timeouts are handled by
+# _make_spotify_request, which backs off outside the concurrency semaphore and
+# pauses every worker via the shared limiter.
+_SESSION = requests.Session()
+_SESSION.headers.update({'User-Agent': 'SoundMatch/1.0'})
+_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=32,
+    max_retries=Retry(
+        total=2,
+        connect=2,
+        read=0,
+        status=0,
+        other=0,
+        backoff_factor=0,
+        respect_retry_after_header=False,
+        raise_on_status=False
+    )
+))
+
+# Methods _make_spotify_request may replay after a read timeout or 5xx; POST is
+# excluded since replaying e.g. a refresh_token grant is not idempotent
+_IDEMPOTENT_METHODS = frozenset(('GET', 'PUT', 'DELETE'))
+
+# Backoff between attempts after a read timeout or 5xx: 0.5s, 1s, 2s... capped,
+# plus up to 50% jitter so workers that failed together don't retry together
+_BACKOFF_BASE = 0.5
+_BACKOFF_MAX = 8
+
+# Normalized tracks by ID, filled by get_tracks_bulk; track metadata never changes
+_TRACK_CACHE = TTLCache(maxsize=10_000, ttl=24 * 60 * 60)
+
+# How long an ID Spotify returned nothing for (unknown or removed) is skipped by
+# the bulk lookups, so bad IDs aren't re-sent on every request but can recover
+_NEGATIVE_TTL = 5 * 60
+_UNKNOWN_TRACKS = TTLCache(maxsize=10_000, ttl=_NEGATIVE_TTL)
+_UNKNOWN_ARTISTS = TTLCache(maxsize=10_000, ttl=_NEGATIVE_TTL)
+
+# Artist objects by ID, filled by get_artists_bulk; artist details change rarely
+_ARTIST_CACHE = TTLCache(maxsize=10_000, ttl=24 * 60 * 60)
+
+# Artists Spotify has no genres for, even via the search fallback; that rarely
+# changes, so skip the search for a day instead of repeating it on every request
+_NO_GENRE_ARTISTS = TTLCache(maxsize=10_000, ttl=24 * 60 * 60)
+
+# Set ENABLE_GENRE_SEARCH_FALLBACK=false to skip the extra artist search that
+# get_artists_bulk(genre_fallback=True) makes for genre-less artists
+ENABLE_GENRE_SEARCH_FALLBACK = os.environ.get('ENABLE_GENRE_SEARCH_FALLBACK', 'true').lower() in ('true', '1', 'yes')
+
+# ETag and decoded body of the last 200 response per GET request, for If-None-Match
+# revalidation. Endpoints already memoized (ttl_cache or the bulk lookup caches)
+# opt out (revalidate=False).
+_ETAG_CACHE = TTLCache(maxsize=1024, ttl=60 * 60)
+
+# Parameters sent with every /recommendations request unless the caller overrides them
+_RECOMMENDATION_DEFAULTS = {'market': 'US', 'limit': 20}
+
+# After /recommendations returns 404 (deprecated for new apps), stop calling it
+# until this many seconds have passed, then check again (set RECS_404_COOLDOWN_S to tune)
+_RECOMMENDATIONS_RECHECK_INTERVAL = int(os.environ.get('RECS_404_COOLDOWN_S', 24 * 60 * 60))
+_recommendations_unavailable_until = 0.0
+
+# Longest Retry-After worth waiting out; beyond this, requests fail fast until
+# the cooldown has passed rather than tying up worker threads
+_MAX_RATE_LIMIT_WAIT = 10
+
+# Spotify search operators are case-sensitive and must stay uppercase
+_SEARCH_OPERATORS = frozenset(('AND', 'OR', 'NOT'))
 
 
 # =============================================================================
@@ -23,43 +133,60 @@ def get_app_token():
     """
     Get a client credentials token for general API usage (not user-specific).
     Used for general search and public data when no user is logged in.
+    
+    The token is shared by every request until 5 minutes before it expires;
+    only one thread fetches a replacement while the others wait for it.
     """
-    global _app_token_cache
+    token = _cached_app_token()
+    if token:
+        return token
     
-    # Check cache
-    if _app_token_cache['token'] and _app_token_cache['expires_at']:
-        if datetime.now() < _app_token_cache['expires_at'] - timedelta(minutes=5):
+    with _APP_TOKEN_LOCK:
+        # Another thread may have refreshed the token while we waited
+        token = _cached_app_token()
+        if token:
+            return token
+        
+        try:
+            token_url = SPOTIFY_TOKEN_URL
+            client_id = current_app.config.get('SPOTIFY_CLIENT_ID')
+            client_secret = current_app.config.get('SPOTIFY_CLIENT_SECRET')
+            
+            if not client_id or not client_secret:
+                logger.error("Missing Spotify credentials in config for App Token")
+                return None
+                
+            data = {
+                'grant_type': 'client_credentials',
+                'client_id': client_id,
+                'client_secret': client_secret
+            }
+            
+            response = _SESSION.post(token_url, data=data, timeout=10)
+            response.raise_for_status()
+            token_info = response_json(response)
+            
+            _app_token_cache['expires_at'] = datetime.now(timezone.utc) + timedelta(
+                seconds=token_info.get('expires_in', 3600))
+            _app_token_cache['token'] = token_info['access_token']
+            
+            logger.info("New App Token generated")
             return _app_token_cache['token']
             
-    # Request new token
-    try:
-        token_url = 'https://accounts.spotify.com/api/token'
-        client_id = current_app.config.get('SPOTIFY_CLIENT_ID')
-        client_secret = current_app.config.get('SPOTIFY_CLIENT_SECRET')
-        
-        if not client_id or not client_secret:
-            print("Missing Spotify credentials in config for App Token")
+        except Exception as e:
+            logger.error("Error getting App Token: %s", e)
             return None
-            
-        data = {
-            'grant_type': 'client_credentials',
-            'client_id': client_id,
-            'client_secret': client_secret
-        }
-        
-        response = requests.post(token_url, data=data)
-        response.raise_for_status()
-        token_info = response.json()
-        
-        _app_token_cache['token'] = token_info['access_token']
-        _app_token_cache['expires_at'] = datetime.now() + timedelta(seconds=token_info['expires_in'])
-        
-        print("[OK] New App Token generated")
-        return _app_token_cache['token']
-        
-    except Exception as e:
-        print(f"Error getting App Token: {str(e)}")
-        return None
+
+
+def _cached_app_token():
+    """
+    Return the cached client credentials token, or None if it is missing or about to expire.
+    """
+    token = _app_token_cache['token']
+    expires_at = _app_token_cache['expires_at']
+    if token and expires_at and datetime.now(timezone.utc) < expires_at - timedelta(minutes=5):
+        return token
+    return None
 
 
 def get_valid_spotify_token(user):
@@ -73,11 +200,13 @@ def get_valid_spotify_token(user):
     Returns:
         str: Valid access token, or None if refresh fails
     """
-    from app import db  # Import here to avoid circular imports
+    cached = _USER_TOKEN_CACHE.get(user.id)
+    if cached and datetime.now(timezone.utc) < cached[1] - timedelta(minutes=5):
+        return cached[0]
     
     # Check if user has Spotify credentials
     if not user.spotify_refresh_token:
-        print(f"User {user.username} has no Spotify refresh token")
+        logger.info("User %s has no Spotify refresh token", user.username)
         return None
     
     # Check if token is still valid
@@ -91,20 +220,39 @@ def get_valid_spotify_token(user):
         # Add 5 minute buffer
         if now < expires_at - timedelta(minutes=5):
             # Token is still valid
+            _USER_TOKEN_CACHE.set(user.id, (user.spotify_access_token, expires_at))
             return user.spotify_access_token
     
-    # Token expired or missing, refresh it
-    print(f"Refreshing Spotify token for user {user.username}")
+    # Token expired or missing, refresh it. Concurrent requests for the same user
+    # wait for one refresh instead of each spending the refresh token.
+    with _USER_REFRESH_LOCKS[hash(user.id) % len(_USER_REFRESH_LOCKS)]:
+        cached = _USER_TOKEN_CACHE.get(user.id)
+        if cached and datetime.now(timezone.utc) < cached[1] - timedelta(minutes=5):
+            return cached[0]
+        return _refresh_user_token(user)
+
+
+def _refresh_user_token(user):
+    """
+    Exchange the user's refresh token for a new access token and store it.
+    
+    Args:
+        user: User object with Spotify OAuth credentials
+    
+    Returns:
+        str: New access token, or None if refresh fails
+    """
+    logger.info("Refreshing Spotify token for user %s", user.username)
     
     try:
-        token_url = 'https://accounts.spotify.com/api/token'
+        token_url = SPOTIFY_TOKEN_URL
         
         # Get credentials from app config
         client_id = current_app.config.get('SPOTIFY_CLIENT_ID')
         client_secret = current_app.config.get('SPOTIFY_CLIENT_SECRET')
         
         if not client_id or not client_secret:
-            print("Missing Spotify credentials in config")
+            logger.error("Missing Spotify credentials in config")
             return None
         
         # Request new token
@@ -115,9 +263,9 @@ def get_valid_spotify_token(user):
             'client_secret': client_secret
         }
         
-        response = requests.post(token_url, data=token_data)
+        response = _SESSION.post(token_url, data=token_data, timeout=10)
         response.raise_for_status()
-        token_info = response.json()
+        token_info = response_json(response)
         
         # Update user's token
         user.spotify_access_token = token_info['access_token']
@@ -127,26 +275,118 @@ def get_valid_spotify_token(user):
         if 'refresh_token' in token_info:
             user.spotify_refresh_token = token_info['refresh_token']
         
-        db.session.commit()
-        print(f"✅ Token refreshed for {user.username}")
+        # Flask-SQLAlchemy registers itself on the app, so no import of app is needed
+        current_app.extensions['sqlalchemy'].session.commit()
+        _USER_TOKEN_CACHE.set(user.id, (user.spotify_access_token, user.spotify_token_expires_at))
+        logger.info("Token refreshed for %s", user.username)
         
         return user.spotify_access_token
         
     except requests.RequestException as e:
-        print(f"Error refreshing Spotify token: {str(e)}")
+        logger.warning("Error refreshing Spotify token: %s", e)
         return None
     except Exception as e:
-        print(f"Unexpected error refreshing token: {str(e)}")
+        logger.exception("Unexpected error refreshing token: %s", e)
         return None
 
 
+def exchange_authorization_code(code, redirect_uri):
+    """
+    Exchange an OAuth authorization code for the user's first tokens.
+    
+    Args:
+        code: Authorization code from the Spotify callback
+        redirect_uri: Redirect URI used when requesting the code
+    
+    Returns:
+        dict: Token response (access_token, refresh_token, expires_in)
+    
+    Raises:
+        requests.RequestException: If the exchange fails
+    """
+    token_data = {
+        'grant_type': 'authorization_code',
+        'code': code,
+        'redirect_uri': redirect_uri,
+        'client_id': current_app.config.get('SPOTIFY_CLIENT_ID'),
+        'client_secret': current_app.config.get('SPOTIFY_CLIENT_SECRET')
+    }
+    
+    response = _SESSION.post(SPOTIFY_TOKEN_URL, data=token_data, timeout=10)
+    response.raise_for_status()
+    return response_json(response)
+
+
+def invalidate_user_token(user_id):
+    """
+    Forget a user's cached access token, e.g. after Spotify rejects it with a 401
+    or the user logs in again, so the next lookup re-reads or refreshes it.
+    
+    Args:
+        user_id: ID of the user whose token should be dropped
+    """
+    _USER_TOKEN_CACHE.pop(user_id)
+
+
 # =============================================================================
 # Helper Functions
 # =============================================================================
 
-def _make_spotify_request(url, headers, params=None, method='GET', data=None, json=None, max_retries=3, silent=False):
+@functools.lru_cache(maxsize=256)
+def _auth_headers(access_token):
+    """
+    Build the Authorization header for a token once and reuse it across calls.
+    
+    The returned dict is shared between callers and must not be modified.
+    """
+    return {'Authorization': f'Bearer {access_token}'}
+
+
+class _CachedResponse:
     """
-    Make a Spotify API request with retry logic and rate limit handling.
+    Minimal stand-in for a 200 response whose JSON body is already decoded.
+    
+    Returned for 200s stored in the ETag cache and for the 304s that replay
+    them, so the cache holds parsed JSON rather than whole Response objects.
+    The decoded body is shared with the cache and must not be modified.
+    """
+    
+    status_code = 200
+    
+    def __init__(self, etag, data):
+        self.headers = {'ETag': etag}
+        self._data = data
+    
+    def json(self):
+        return self._data
+    
+    def raise_for_status(self):
+        pass
+
+
+def rate_limit_remaining():
+    """
+    Seconds until Spotify calls are allowed again after a 429 (0 if not rate limited).
+    """
+    return _SPOTIFY_LIMITER.cooldown_remaining()
+
+
+def _backoff_delay(attempt):
+    """
+    Seconds to wait before retry number `attempt` (0-based) after a transient failure.
+    """
+    return min(_BACKOFF_MAX, _BACKOFF_BASE * 2 ** attempt) * (1 + random.random() * 0.5)
+
+
+def _make_spotify_request(url, headers, params=None, method='GET', data=None, json=None, max_retries=3, silent=False,
+                          revalidate=True):
+    """
+    Make a Spotify API request with rate limit and transient error handling.
+    
+    429s pause every worker via the shared limiter. Read timeouts and 5xx
+    responses are retried with jittered backoff for idempotent methods. All
+    waiting happens outside the concurrency semaphore, so a backing-off
+    thread never holds a request slot.
     
     Args:
         url: API endpoint URL
@@ -155,62 +395,92 @@ def _make_spotify_request(url, headers, params=None, method='GET', data=None, js
         method: HTTP method (GET, POST, PUT, etc.)
         data: Form data
         json: JSON data
-        max_retries: Maximum number of retry attempts
+        max_retries: Maximum number of attempts (429s, timeouts and 5xx)
         silent: If True, suppress non-critical error messages
+        revalidate: If False, skip the ETag cache (for GETs whose results are
+            already cached by ttl_cache or a bulk lookup cache)
     
     Returns:
-        requests.Response or None if all retries fail
+        requests.Response (or a cached stand-in for ETag-cached GETs), or None
+        if all retries fail
     """
+    method = method.upper()
+    retryable = method in _IDEMPOTENT_METHODS
+    
+    # Conditional GET: if we hold a response with an ETag for this exact request,
+    # ask Spotify to answer 304 (empty body) when it hasn't changed
+    etag_key = None
+    cached = None
+    if method == 'GET' and revalidate:
+        # params may be a dict or an already-encoded query string (search)
+        param_key = tuple(sorted(params.items())) if isinstance(params, dict) else params
+        etag_key = (headers.get('Authorization'), url, param_key)
+        cached = _ETAG_CACHE.get(etag_key)
+        if cached:
+            headers = {**headers, 'If-None-Match': cached[0]}
+    
     for attempt in range(max_retries):
+        # Circuit breaker: while Spotify has asked for a long pause, fail fast
+        # instead of parking this worker thread for the whole window
+        remaining = _SPOTIFY_LIMITER.cooldown_remaining()
+        if remaining > _MAX_RATE_LIMIT_WAIT:
+            if not silent:
+                logger.warning("Rate limited for another %.0fs, skipping request", remaining)
+            return None
+        
+        last_attempt = attempt == max_retries - 1
         try:
-            if method.upper() == 'GET':
-                response = requests.get(url, headers=headers, params=params, timeout=10)
-            elif method.upper() == 'POST':
-                response = requests.post(url, headers=headers, params=params, data=data, json=json, timeout=10)
-            elif method.upper() == 'PUT':
-                response = requests.put(url, headers=headers, params=params, data=data, json=json, timeout=10)
-            else:
-                response = requests.request(method, url, headers=headers, params=params, data=data, json=json, timeout=10)
+            _SPOTIFY_LIMITER.acquire()
             
-            # Handle rate limiting (429 Too Many Requests)
-            if response.status_code == 429:
-                retry_after = int(response.headers.get('Retry-After', 5))
-                # Cap wait time to avoid hanging too long (e.g. max 10 seconds)
-                # If Spotify asks for more, we might just fail this request
-                wait_time = min(retry_after, 10) 
-                
-                if not silent:
-                    print(f"Rate limited (429). Waiting {wait_time}s... (Spotify asked for {retry_after}s)")
-                
-                time.sleep(wait_time)
-                
-                # If the wait time was capped and less than requested, 
-                # we might still fail the next request, but we'll try once more
+            with _SPOTIFY_CONCURRENCY:
+                response = _SESSION.request(method, url, headers=headers, params=params,
+                                            data=data, json=json, timeout=10)
+        except requests.Timeout:
+            if retryable and not last_attempt:
+                time.sleep(_backoff_delay(attempt))
                 continue
+            if not silent:
+                logger.warning("Request to %s timed out", url)
+            return None
+        except requests.RequestException as e:
+            # Connection failures were already retried by the adapter
+            if not silent:
+                logger.warning("Request to %s failed: %s", url, e)
+            return None
+        
+        # Handle rate limiting (429 Too Many Requests)
+        if response.status_code == 429:
+            retry_after = int(response.headers.get('Retry-After', 5))
             
-            # Return response for caller to handle (401, 403, 200, etc.)
-            return response
+            # Hold back every worker for the full window Spotify asked for; the
+            # next acquire() sleeps (with jitter) until the cooldown has passed
+            _SPOTIFY_LIMITER.cooldown(retry_after)
             
-        except requests.Timeout:
-            if attempt < max_retries - 1:
-                wait_time = 2 ** attempt  # Exponential backoff
-                if not silent:
-                    print(f"Request timeout. Retrying in {wait_time}s...")
-                time.sleep(wait_time)
-            else:
-                if not silent:
-                    print(f"Request timeout after {max_retries} attempts")
-                return None
-        except requests.RequestException as e:
-            if attempt < max_retries - 1:
-                wait_time = 2 ** attempt  # Exponential backoff
-                if not silent:
-                    print(f"Request error: {str(e)}. Retrying in {wait_time}s...")
-                time.sleep(wait_time)
-            else:
+            if retry_after > _MAX_RATE_LIMIT_WAIT:
                 if not silent:
-                    print(f"Request failed after {max_retries} attempts")
+                    logger.warning("Rate limited (429) for %ss, giving up on this request", retry_after)
                 return None
+            
+            if not silent:
+                logger.warning("Rate limited (429). Waiting %ss...", retry_after)
+            continue
+        
+        if response.status_code >= 500 and retryable and not last_attempt:
+            if not silent:
+                logger.warning("Spotify returned %s for %s, retrying", response.status_code, url)
+            time.sleep(_backoff_delay(attempt))
+            continue
+        
+        if cached and response.status_code == 304:
+            return _CachedResponse(*cached)
+        if etag_key and response.status_code == 200 and response.headers.get('ETag'):
+            etag = response.headers['ETag']
+            body = response_json(response)
+            _ETAG_CACHE.set(etag_key, (etag, body))
+            return _CachedResponse(etag, body)
+        
+        # Return response for caller to handle (401, 403, 200, etc.)
+        return response
     
     return None
 
@@ -219,13 +489,33 @@ def _make_spotify_request(url, headers, params=None, method='GET', data=None, js
 # User Data Retrieval
 # =============================================================================
 
+def get_user_profile(access_token):
+    """
+    Fetch the current user's Spotify profile.
+    
+    Args:
+        access_token: Valid Spotify access token
+    
+    Returns:
+        dict: Profile data (id, email, display_name, ...)
+    
+    Raises:
+        requests.RequestException: If the request fails or Spotify returns an error
+    """
+    response = _make_spotify_request(f'{SPOTIFY_API_BASE_URL}/me', _auth_headers(access_token))
+    if response is None:
+        raise requests.ConnectionError('Spotify profile request failed')
+    response.raise_for_status()
+    return response_json(response)
+
+
 def get_user_top_tracks(access_token, time_range='medium_term', limit=20):
     """
     Fetch user's top tracks from Spotify.
     """
     try:
-        url = 'https://api.spotify.com/v1/me/top/tracks'
-        headers = {'Authorization': f'Bearer {access_token}'}
+        url = f'{SPOTIFY_API_BASE_URL}/me/top/tracks'
+        headers = _auth_headers(access_token)
         params = {
             'time_range': time_range,
             'limit': min(limit, 50)
@@ -237,18 +527,12 @@ def get_user_top_tracks(access_token, time_range='medium_term', limit=20):
             return []
             
         response.raise_for_status()
-        data = response.json()
-        
-        tracks = []
-        for item in data.get('items', []):
-            normalized = normalize_track(item)
-            if normalized:
-                tracks.append(normalized)
+        data = response_json(response)
         
-        return tracks
+        return [track for track in map(normalize_track, data.get('items', [])) if track]
         
     except Exception as e:
-        print(f"Error fetching top tracks: {str(e)}")
+        logger.error("Error fetching top tracks: %s", e)
         return []
 
 
@@ -257,8 +541,8 @@ def get_user_top_artists(access_token, time_range='medium_term', limit=20):
     Fetch user's top artists from Spotify.
     """
     try:
-        url = 'https://api.spotify.com/v1/me/top/artists'
-        headers = {'Authorization': f'Bearer {access_token}'}
+        url = f'{SPOTIFY_API_BASE_URL}/me/top/artists'
+        headers = _auth_headers(access_token)
         params = {
             'time_range': time_range,
             'limit': min(limit, 50)
@@ -270,23 +554,22 @@ def get_user_top_artists(access_token, time_range='medium_term', limit=20):
             return []
             
         response.raise_for_status()
-        data = response.json()
+        data = response_json(response)
         
-        artists = []
-        for item in data.get('items', []):
-            artists.append({
+        return [
+            {
                 'id': item['id'],
                 'name': item['name'],
                 'genres': item.get('genres', []),
                 'image_url': item['images'][0]['url'] if item['images'] else None,
                 'spotify_url': item['external_urls']['spotify'],
                 'popularity': item.get('popularity', 0)
-            })
-        
-        return artists
+            }
+            for item in data.get('items', [])
+        ]
         
     except Exception as e:
-        print(f"Error fetching top artists: {str(e)}")
+        logger.error("Error fetching top artists: %s", e)
         return []
 
 
@@ -295,8 +578,8 @@ def get_user_recently_played(access_token, limit=50):
     Fetch user's recently played tracks.
     """
     try:
-        url = 'https://api.spotify.com/v1/me/player/recently-played'
-        headers = {'Authorization': f'Bearer {access_token}'}
+        url = f'{SPOTIFY_API_BASE_URL}/me/player/recently-played'
+        headers = _auth_headers(access_token)
         params = {'limit': min(limit, 50)}
         
         response = _make_spotify_request(url, headers, params=params)
@@ -305,7 +588,7 @@ def get_user_recently_played(access_token, limit=50):
             return []
             
         response.raise_for_status()
-        data = response.json()
+        data = response_json(response)
         
         tracks = []
         for item in data.get('items', []):
@@ -319,7 +602,7 @@ def get_user_recently_played(access_token, limit=50):
         return tracks
         
     except Exception as e:
-        print(f"Error fetching recently played: {str(e)}")
+        logger.error("Error fetching recently played: %s", e)
         return []
 
 
@@ -331,18 +614,23 @@ def get_recommendations(access_token, seed_tracks=None, seed_artists=None, seed_
     """
     Get track recommendations from Spotify.
     """
+    global _recommendations_unavailable_until
+    
+    # Skip the round-trip while the endpoint is known to be gone (see 404 below)
+    if time.monotonic() < _recommendations_unavailable_until:
+        return []
+    
     try:
-        url = 'https://api.spotify.com/v1/recommendations'
-        headers = {'Authorization': f'Bearer {access_token}'}
-        
-        # Build parameters
-        request_params = params.copy()
+        # Validate we have at least one seed before building anything
+        if not (seed_tracks or seed_artists or seed_genres):
+            logger.warning("No seeds provided for recommendations")
+            return []
         
-        # Add market parameter (helps with availability)
-        if 'market' not in request_params:
-            request_params['market'] = 'US'
+        url = f'{SPOTIFY_API_BASE_URL}/recommendations'
+        headers = _auth_headers(access_token)
         
-        # Add seeds
+        # Defaults (market helps with availability), then caller overrides, then seeds
+        request_params = {**_RECOMMENDATION_DEFAULTS, **params}
         if seed_tracks:
             request_params['seed_tracks'] = ','.join(seed_tracks[:5])
         if seed_artists:
@@ -350,111 +638,202 @@ def get_recommendations(access_token, seed_tracks=None, seed_artists=None, seed_
         if seed_genres:
             request_params['seed_genres'] = ','.join(seed_genres[:5])
         
-        # Validate we have at least one seed
-        has_seeds = bool(seed_tracks or seed_artists or seed_genres)
-        if not has_seeds:
-            print("No seeds provided for recommendations")
-            return []
-        
-        # Set default limit if not provided
-        if 'limit' not in request_params:
-            request_params['limit'] = 20
-        
-        print(f"Requesting recommendations with params: {request_params}")
+        logger.debug("Requesting recommendations with params: %s", request_params)
         
         response = _make_spotify_request(url, headers, params=request_params)
         
-        if not response:
+        # Not `if not response`: a Response is falsy for 4xx, which would skip the checks below
+        if response is None:
             return []
         
         # Handle 404 - recommendations endpoint is deprecated (Nov 2024)
         if response.status_code == 404:
-            print(f"⚠️  Recommendations endpoint deprecated (404) - This endpoint is no longer available for new applications")
-            print(f"   Using alternative recommendation methods instead")
+            logger.info("Recommendations endpoint deprecated (404) - using alternative recommendation methods instead")
+            _recommendations_unavailable_until = time.monotonic() + _RECOMMENDATIONS_RECHECK_INTERVAL
             return []
         
         # Handle 401 - authentication issue
         if response.status_code == 401:
-            print(f"Authentication failed (401) - Token may be invalid or missing scopes")
+            logger.warning("Authentication failed (401) - Token may be invalid or missing scopes")
             return []
         
         response.raise_for_status()
-        data = response.json()
+        data = response_json(response)
         
-        recommendations = []
-        for track in data.get('tracks', []):
-            normalized = normalize_track(track)
-            if normalized:
-                recommendations.append(normalized)
+        recommendations = [track for track in map(normalize_track, data.get('tracks', [])) if track]
         
-        print(f"Successfully got {len(recommendations)} recommendations from Spotify")
+        logger.debug("Got %d recommendations from Spotify", len(recommendations))
         return recommendations
         
     except Exception as e:
-        print(f"Error getting recommendations: {str(e)}")
+        logger.error("Error getting recommendations: %s", e)
         return []
 
 
+def normalize_search_query(query):
+    """
+    Normalize a search query so equivalent queries produce the same request.
+    
+    Spotify search is case-insensitive, so the query is lowercased and its
+    whitespace collapsed. Boolean operators (AND, OR, NOT) keep their case.
+    
+    Args:
+        query: Raw search query
+    
+    Returns:
+        str: Normalized query
+    """
+    return ' '.join(
+        word if word in _SEARCH_OPERATORS else word.lower()
+        for word in query.split()
+    )
+
+
+def _copy_tracks(tracks):
+    """
+    Shallow-copy cached track dicts; the engine annotates them per request
+    (preview_url, lastfm_match).
+    """
+    return [dict(track) for track in tracks]
+
+
+@ttl_cache(maxsize=4096, ttl=60 * 60, copy=_copy_tracks,
+           key=lambda access_token, query, limit=20: (normalize_search_query(query), min(limit, 50)))
 def search_tracks(access_token, query, limit=20):
     """
     Search for tracks on Spotify.
     """
     try:
-        url = 'https://api.spotify.com/v1/search'
-        headers = {'Authorization': f'Bearer {access_token}'}
-        params = {
-            'q': query,
-            'type': 'track',
-            'limit': min(limit, 50)
-        }
+        url = f'{SPOTIFY_API_BASE_URL}/search'
+        headers = _auth_headers(access_token)
+        # Encode the query string once up front instead of letting requests
+        # rebuild it from a dict on every attempt
+        params = urlencode(
+            (('q', normalize_search_query(query)), ('type', 'track'), ('limit', min(limit, 50))),
+            quote_via=quote
+        )
         
-        response = _make_spotify_request(url, headers, params=params)
+        response = _make_spotify_request(url, headers, params=params, revalidate=False)
         
         if not response:
             return []
             
         response.raise_for_status()
-        data = response.json()
+        data = response_json(response)
         
-        tracks = []
-        for track in data.get('tracks', {}).get('items', []):
-            normalized = normalize_track(track)
-            if normalized:
-                tracks.append(normalized)
-        
-        return tracks
+        return [track for track in map(normalize_track, data.get('tracks', {}).get('items', [])) if track]
         
     except Exception as e:
-        print(f"Error searching tracks: {str(e)}")
+        logger.error("Error searching tracks: %s", e)
         return []
 
 
-def get_track(access_token, track_id):
+def search_artist_catalog(access_token, artist_name, limit=50):
     """
-    Get a single track by ID.
+    Search for tracks by one artist, so several of their tracks can be
+    matched from a single request.
     
     Args:
         access_token: Valid Spotify access token
-        track_id: Spotify track ID
+        artist_name: Artist name to search for
+        limit: Maximum number of tracks (Spotify allows up to 50)
     
     Returns:
-        dict: Normalized track dictionary, or None if failed
+        list: Normalized track dictionaries
     """
-    try:
-        url = f'https://api.spotify.com/v1/tracks/{track_id}'
-        headers = {'Authorization': f'Bearer {access_token}'}
-        
-        response = _make_spotify_request(url, headers)
-        
-        if not response or response.status_code != 200:
-            return None
+    return search_tracks(access_token, f'artist:"{artist_name}"', limit=limit)
+
+
+def search_artists(access_token, query, limit=10):
+    """
+    Search for artists on Spotify.
+    
+    Args:
+        access_token: Valid Spotify access token
+        query: Search query (artist name)
+        limit: Maximum number of artists (Spotify allows up to 50)
+    
+    Returns:
+        tuple: (artists, status_code) - the artist dictionaries (empty on
+        error) and Spotify's HTTP status, or None if no response was received
+        (timed out, failed to connect, or rate limited)
+    """
+    url = f'{SPOTIFY_API_BASE_URL}/search'
+    params = {'q': query, 'type': 'artist', 'limit': min(limit, 50)}
+    
+    response = _make_spotify_request(url, _auth_headers(access_token), params=params)
+    if response is None:
+        return [], None
+    if response.status_code >= 400:
+        logger.warning("Spotify artist search failed: %s - %s", response.status_code, response.text)
+        return [], response.status_code
+    
+    artists = []
+    for artist in response_json(response).get('artists', {}).get('items', []):
+        try:
+            artists.append({
+                'id': artist['id'],
+                'name': artist['name'],
+                'genres': artist.get('genres', []),
+                'image_url': artist['images'][0]['url'] if artist.get('images') else None,
+                'spotify_url': artist['external_urls']['spotify'],
+                'popularity': artist.get('popularity', 0),
+                'followers': artist.get('followers', {}).get('total', 0)
+            })
+        except (KeyError, IndexError) as e:
+            logger.debug("Error parsing artist data: %s", e)
+    
+    return artists, response.status_code
+
+
+def get_tracks_bulk(access_token, track_ids):
+    """
+    Get several tracks by ID, 50 per request.
+    
+    Tracks fetched in the last day are served from _TRACK_CACHE; the rest
+    are fetched and added to it. IDs Spotify recently returned nothing for
+    are skipped.
+    
+    Args:
+        access_token: Valid Spotify access token
+        track_ids: List of Spotify track IDs
+    
+    Returns:
+        dict: Normalized track dictionaries keyed by track ID (missing IDs are omitted)
+    """
+    tracks = {}
+    missing = []
+    for track_id in dict.fromkeys(track_ids):
+        cached = _TRACK_CACHE.get(track_id)
+        if cached:
+            tracks[track_id] = dict(cached)
+        elif not _UNKNOWN_TRACKS.get(track_id):
+            missing.append(track_id)
+    
+    url = f'{SPOTIFY_API_BASE_URL}/tracks'
+    headers = _auth_headers(access_token)
+    
+    for start in range(0, len(missing), 50):
+        chunk = missing[start:start + 50]
+        try:
+            response = _make_spotify_request(url, headers, params={'ids': ','.join(chunk)}, revalidate=False)
             
-        track = response.json()
-        return normalize_track(track)
-        
-    except Exception as e:
-        print(f"Error getting track {track_id}: {str(e)}")
-        return None
+            if not response or response.status_code != 200:
+                continue
+            
+            for track in response_json(response).get('tracks', []):
+                normalized = normalize_track(track)
+                if normalized:
+                    track_id = normalized['id']
+                    tracks[track_id] = normalized
+                    _TRACK_CACHE.set(track_id, dict(normalized))
+            for track_id in chunk:
+                if track_id not in tracks:
+                    _UNKNOWN_TRACKS.set(track_id, True)
+        except Exception as e:
+            logger.error("Error getting tracks %s: %s", chunk, e)
+    
+    return tracks
 
 
 def normalize_track(track):
@@ -467,157 +846,91 @@ def normalize_track(track):
     Returns:
         dict: Normalized track dictionary, or None if track is invalid
     """
-    if not track or not track.get('id'):
+    if not track:
+        return None
+    get = track.get
+    track_id = get('id')
+    if not track_id:
         return None
     
     # Extract artist name(s) as string
-    artist_names = []
-    if track.get('artist'):  # Already a string
-        artist_string = track['artist']
-    elif track.get('artists'):
-        if isinstance(track['artists'], list):
-            artist_names = [a.get('name', 'Unknown Artist') if isinstance(a, dict) else str(a) for a in track['artists']]
+    artists = get('artists', [])
+    artist_string = get('artist')  # Already a string on normalized tracks
+    if not artist_string:
+        if not artists:
+            artist_string = 'Unknown Artist'
+        elif isinstance(artists, list):
+            try:
+                # Spotify's schema: a list of artist objects
+                artist_string = ', '.join([a.get('name', 'Unknown Artist') for a in artists])
+            except AttributeError:
+                artist_string = ', '.join([a.get('name', 'Unknown Artist') if isinstance(a, dict) else str(a)
+                                           for a in artists])
         else:
-            artist_names = [str(track['artists'])]
-        artist_string = ', '.join(artist_names) if artist_names else 'Unknown Artist'
-    else:
-        artist_string = 'Unknown Artist'
+            artist_string = str(artists)
     
     # Extract image URL from album
-    image_url = track.get('image_url')
-    if not image_url and track.get('album'):
-        album = track['album']
-        if isinstance(album, dict) and album.get('images'):
-            image_url = album['images'][0].get('url') if album['images'] else None
+    album = get('album', {})
+    image_url = get('image_url')
+    if not image_url and album and isinstance(album, dict):
+        images = album.get('images')
+        if images:
+            image_url = images[0].get('url')
     
     # Extract Spotify URL
-    spotify_url = track.get('spotify_url')
-    if not spotify_url and track.get('external_urls'):
-        spotify_url = track['external_urls'].get('spotify')
-    
-    # Extract preview URL - Spotify provides 30-second previews for most tracks
-    preview_url = track.get('preview_url')
-    # Some tracks might have null preview_url, which is valid (not all tracks have previews)
-    # Keep it as None if not available, don't try to generate one
+    external_urls = get('external_urls', {})
+    spotify_url = get('spotify_url')
+    if not spotify_url and external_urls:
+        spotify_url = external_urls.get('spotify')
     
+    # Spotify provides 30-second previews for most tracks; a null preview_url is
+    # valid (not all tracks have previews), so keep it as None if not available
     return {
-        'id': track['id'],
-        'name': track.get('name', 'Unknown Track'),
+        'id': track_id,
+        'name': get('name', 'Unknown Track'),
         'artist': artist_string,  # String for display
-        'artists': track.get('artists', []),  # Keep as array for consistency
-        'album': track.get('album', {}),  # Keep as object for consistency
+        'artists': artists,  # Keep as array for consistency
+        'album': album,  # Keep as object for consistency
         'image_url': image_url,  # For display
-        'preview_url': preview_url,  # 30-second preview URL (can be null)
+        'preview_url': get('preview_url'),  # 30-second preview URL (can be null)
         'spotify_url': spotify_url,
-        'external_urls': track.get('external_urls', {}),
-        'popularity': track.get('popularity', 0)
+        'external_urls': external_urls,
+        'popularity': get('popularity', 0)
     }
 
 
-def get_artist_genres(access_token, artist_id):
-    """
-    Get genres for an artist.
-    """
-    try:
-        url = f'https://api.spotify.com/v1/artists/{artist_id}'
-        headers = {'Authorization': f'Bearer {access_token}'}
-        
-        response = _make_spotify_request(url, headers)
-        
-        if response and response.status_code == 200:
-            artist = response.json()
-            genres = artist.get('genres', [])
-            if genres:
-                print(f"Found {len(genres)} genres for artist {artist_id}: {genres[:3]}")
-            else:
-                print(f"No genres found for artist {artist_id} - this is normal for some artists")
-                # Try to infer genre from artist name or use search
-                artist_name = artist.get('name', '')
-                if artist_name:
-                    # Try searching for the artist to see if we can find genre info
-                    search_url = 'https://api.spotify.com/v1/search'
-                    search_params = {
-                        'q': f'artist:"{artist_name}"',
-                        'type': 'artist',
-                        'limit': 1
-                    }
-                    try:
-                        search_response = _make_spotify_request(search_url, headers, params=search_params)
-                        if search_response and search_response.status_code == 200:
-                            search_data = search_response.json()
-                            search_artists = search_data.get('artists', {}).get('items', [])
-                            if search_artists and search_artists[0].get('genres'):
-                                genres = search_artists[0].get('genres', [])
-                                print(f"Found genres via search for {artist_name}: {genres[:3]}")
-                    except:
-                        pass
-            return genres
-        elif response and response.status_code == 404:
-            print(f"Artist {artist_id} not found (404) - may be invalid ID")
-            return []
-        else:
-            status = response.status_code if response else "Unknown"
-            print(f"Failed to get artist info for {artist_id}: Status {status}")
-            return []
-    except Exception as e:
-        print(f"Error getting artist genres for {artist_id}: {str(e)}")
-        return []
-
-
-def get_track_artists(access_token, track_id):
-    """
-    Get artist IDs from a track.
-    """
-    try:
-        url = f'https://api.spotify.com/v1/tracks/{track_id}'
-        headers = {'Authorization': f'Bearer {access_token}'}
-        
-        response = _make_spotify_request(url, headers)
-        
-        if response and response.status_code == 200:
-            track = response.json()
-            return [artist['id'] for artist in track.get('artists', [])]
-        return []
-    except Exception as e:
-        print(f"Error getting track artists: {str(e)}")
-        return []
-
-
 def get_artist_top_tracks_for_recommendations(access_token, artist_ids, limit=20):
     """
     Fallback method: Get top tracks from multiple artists as recommendations.
     Used when recommendations API is not available (client credentials limitation).
     """
     try:
-        all_tracks = []
         tracks_per_artist = max(5, limit // len(artist_ids)) if artist_ids else 10
+        headers = _auth_headers(access_token)
         
-        for artist_id in artist_ids[:5]:  # Limit to 5 artists
-            url = f'https://api.spotify.com/v1/artists/{artist_id}/top-tracks'
-            headers = {'Authorization': f'Bearer {access_token}'}
-            params = {'market': 'US'}
-            
-            response = _make_spotify_request(url, headers, params=params)
+        def fetch_top_tracks(artist_id):
+            url = f'{SPOTIFY_API_BASE_URL}/artists/{artist_id}/top-tracks'
+            response = _make_spotify_request(url, headers, params={'market': 'US'})
             
             if response and response.status_code == 200:
-                data = response.json()
-                tracks = data.get('tracks', [])
-                
-                for track in tracks[:tracks_per_artist]:
-                    normalized = normalize_track(track)
-                    if normalized:
-                        all_tracks.append(normalized)
-            else:
-                status = response.status_code if response else "Unknown"
-                print(f"Failed to get top tracks for artist {artist_id}: {status}")
-        
-        # Shuffle and limit
-        import random
-        random.shuffle(all_tracks)
-        return all_tracks[:limit]
+                tracks = response_json(response).get('tracks', [])
+                return [normalize_track(track) for track in tracks[:tracks_per_artist]]
+            
+            status = response.status_code if response is not None else "Unknown"
+            logger.warning("Failed to get top tracks for artist %s: %s", artist_id, status)
+            return []
+        
+        # The per-artist calls are independent, so issue them together (limit 5 artists)
+        artist_ids = artist_ids[:5]
+        with ThreadPoolExecutor(max_workers=max(1, len(artist_ids))) as executor:
+            all_tracks = [track for tracks in executor.map(fetch_top_tracks, artist_ids)
+                          for track in tracks if track]
+        
+        # Random selection of up to `limit` tracks
+        return random.sample(all_tracks, min(limit, len(all_tracks)))
         
     except Exception as e:
-        print(f"Error getting artist top tracks: {str(e)}")
+        logger.error("Error getting artist top tracks: %s", e)
         return []
 
 
@@ -626,11 +939,9 @@ def add_track_to_spotify_library(access_token, track_id):
     Add a track to the user's Spotify library (liked songs).
     """
     try:
-        url = 'https://api.spotify.com/v1/me/tracks'
-        headers = {
-            'Authorization': f'Bearer {access_token}',
-            'Content-Type': 'application/json'
-        }
+        url = f'{SPOTIFY_API_BASE_URL}/me/tracks'
+        # requests sets Content-Type: application/json for json= bodies
+        headers = _auth_headers(access_token)
         data = {'ids': [track_id]}
         
         response = _make_spotify_request(url, headers, json=data, method='PUT')
@@ -641,23 +952,94 @@ def add_track_to_spotify_library(access_token, track_id):
         return False
         
     except Exception as e:
-        print(f"Error adding track to Spotify library: {str(e)}")
+        logger.error("Error adding track to Spotify library: %s", e)
         return False
 
 
-def get_artist_info(access_token, artist_id):
+def _search_artist_genres(headers, artist_name):
     """
-    Get artist information by ID.
+    Look up an artist's genres via search, for artists whose own entry lists none.
+    
+    Returns:
+        list: Genres of the top search match (empty if it has none), or None
+        if the search failed
     """
-    try:
-        url = f'https://api.spotify.com/v1/artists/{artist_id}'
-        headers = {'Authorization': f'Bearer {access_token}'}
-        
-        response = _make_spotify_request(url, headers)
-        
-        if response and response.status_code == 200:
-            return response.json()
-        return None
-    except Exception as e:
-        print(f"Error getting artist info: {str(e)}")
+    params = {'q': f'artist:"{artist_name}"', 'type': 'artist', 'limit': 1}
+    response = _make_spotify_request(f'{SPOTIFY_API_BASE_URL}/search', headers, params=params,
+                                     revalidate=False)
+    if not response or response.status_code != 200:
         return None
+    
+    items = response_json(response).get('artists', {}).get('items', [])
+    genres = items[0].get('genres', []) if items else []
+    if genres:
+        logger.debug("Found genres via search for %s: %s", artist_name, genres[:3])
+    return genres
+
+
+def get_artists_bulk(access_token, artist_ids, genre_fallback=False):
+    """
+    Get several artists by ID, 50 per request.
+    
+    Artists fetched in the last day are served from _ARTIST_CACHE; the
+    rest are fetched and added to it. IDs Spotify recently returned nothing
+    for are skipped.
+    
+    Args:
+        access_token: Valid Spotify access token
+        artist_ids: List of Spotify artist IDs
+        genre_fallback: If True, fill in genres for artists Spotify lists none
+            for by searching for the artist (see ENABLE_GENRE_SEARCH_FALLBACK)
+    
+    Returns:
+        list: Artist dictionaries in input order, with None for IDs that could not be fetched
+    """
+    artists = {}
+    missing = []
+    for artist_id in dict.fromkeys(artist_ids):
+        cached = _ARTIST_CACHE.get(artist_id)
+        if cached:
+            artists[artist_id] = cached
+        elif not _UNKNOWN_ARTISTS.get(artist_id):
+            missing.append(artist_id)
+    
+    url = f'{SPOTIFY_API_BASE_URL}/artists'
+    headers = _auth_headers(access_token)
+    
+    for start in range(0, len(missing), 50):
+        chunk = missing[start:start + 50]
+        try:
+            response = _make_spotify_request(url, headers, params={'ids': ','.join(chunk)}, revalidate=False)
+            
+            if not response or response.status_code != 200:
+                continue
+            
+            for artist in response_json(response).get('artists', []):
+                if artist and artist.get('id'):
+                    artist_id = artist['id']
+                    artists[artist_id] = artist
+                    _ARTIST_CACHE.set(artist_id, artist)
+            for artist_id in chunk:
+                if artist_id not in artists:
+                    _UNKNOWN_ARTISTS.set(artist_id, True)
+        except Exception as e:
+            logger.error("Error getting artists %s: %s", chunk, e)
+    
+    if genre_fallback and ENABLE_GENRE_SEARCH_FALLBACK:
+        for artist_id, artist in list(artists.items()):
+            if artist.get('genres') or not artist.get('name') or _NO_GENRE_ARTISTS.get(artist_id):
+                continue
+            try:
+                genres = _search_artist_genres(headers, artist['name'])
+            except Exception as e:
+                logger.warning("Error searching genres for %s: %s", artist['name'], e)
+                continue
+            # Only a definite answer marks the artist as genre-less, not a failed search
+            if genres:
+                artists[artist_id] = {**artist, 'genres': genres}
+                _ARTIST_CACHE.set(artist_id, artists[artist_id])
+            elif genres is not None:
+                logger.debug("No genres found for artist %s - this is normal for some artists", artist_id)
+                _NO_GENRE_ARTISTS.set(artist_id, True)
+    
+    return [artists.get(artist_id) for artist_id in artist_ids]
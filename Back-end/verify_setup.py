@@ -1,6 +1,7 @@
 import os
 import sys
 import importlib.util
+from importlib.metadata import distributions
 from pathlib import Path
 
 def print_status(message, status):
@@ -13,13 +14,21 @@ def check_python_version():
     print_status(f"Python 3.8+ (Current: {version.major}.{version.minor}.{version.micro})", is_valid)
     return is_valid
 
+# Import names whose distribution is published under a different name
+DIST_NAMES = {'dotenv': 'python_dotenv'}
+
 def check_dependencies():
     required = ['flask', 'requests', 'dotenv', 'flask_sqlalchemy', 'flask_login', 'flask_bcrypt', 'flask_limiter', 'flask_wtf']
+    # One pass over installed distributions instead of a sys.path scan per package
+    installed = {
+        (dist.metadata['Name'] or '').lower().replace('-', '_')
+        for dist in distributions()
+    }
     all_installed = True
     print("\nChecking dependencies:")
     for package in required:
-        spec = importlib.util.find_spec(package)
-        is_installed = spec is not None
+        is_installed = (DIST_NAMES.get(package, package) in installed
+                        or importlib.util.find_spec(package) is not None)
         print_status(f"Package '{package}' installed", is_installed)
         if not is_installed:
             all_installed = False